@@ -71,13 +71,6 @@ async def get_current_user_info(current_user: Dict[str, Any] = Depends(get_curre
         permissions=current_user["permissions"]
     )
 
-@router.post("/logout")
-async def logout(current_user: Dict[str, Any] = Depends(get_current_user)):
-    """Logout user (client-side token removal)"""
-    # In a real application, you might want to blacklist the token
-    # For JWT tokens, logout is typically handled client-side
-    return {"message": "Successfully logged out"}
-
 @router.post("/refresh")
 async def refresh_token(current_user: Dict[str, Any] = Depends(get_current_user)):
     """Refresh access token"""
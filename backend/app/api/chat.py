@@ -12,12 +12,14 @@ from ..services.local_email_service import local_email_service
 # Use local services in development, AWS services in production
 if settings.is_local:
     user_service = local_user_management_service
-    email_service = local_email_service
+    
+    def get_email_service():
+        return local_email_service
 else:
     from ..services.aws_user_management_service import aws_user_management_service
-    from ..services.email_verification_service import email_verification_service
+    from ..services.email_verification_service import get_email_verification_service
     user_service = aws_user_management_service
-    email_service = email_verification_service
+    get_email_service = get_email_verification_service
 # from ..services.weekly_digest_service import weekly_digest_service
 from ..core.ai_provider import ai_manager
 from ..core.auth import get_optional_user
@@ -297,6 +299,13 @@ async def get_available_tables():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/tables/refresh-schema")
+async def refresh_table_schema(admin_user: Dict[str, Any] = Depends(require_admin)):
+    """Drop cached table and schema metadata so the next query re-reads Snowflake (admin only)"""
+    bi_service.invalidate_schema_cache()
+    return {"message": "Schema cache cleared"}
+
+
 @router.get("/tables/{table_name}/schema")
 async def get_table_schema(table_name: str):
     """Get schema information for a specific table"""
@@ -314,7 +323,7 @@ async def get_table_sample(table_name: str, limit: int = 10):
     try:
         sample_df = bi_service.snowflake_db.get_table_sample(table_name, limit)
         # Clean the DataFrame to ensure JSON serialization compatibility
-        cleaned_df = bi_service._clean_dataframe_for_json(sample_df)
+        cleaned_df = bi_service._finalize_dataframe_for_json(sample_df)
         return {
             "table_name": table_name,
             "sample_data": cleaned_df.to_dict('records'),
@@ -517,7 +526,7 @@ async def request_password_reset(request: ResetPasswordRequest):
         # Get user to verify they exist
         user = user_service._get_user_by_email(request.email)
         if user:
-            await email_service.send_password_reset_email(request.email, user.user_id)
+            await get_email_service().send_password_reset_email(request.email, user.user_id)
         
         # Always return success to prevent email enumeration
         return {"message": "If an account with this email exists, a password reset link has been sent."}
@@ -532,7 +541,7 @@ async def confirm_password_reset(request: ConfirmPasswordResetRequest):
     """Confirm password reset with new password"""
     try:
         # Verify reset token
-        user_id = await email_service.verify_password_reset_token(request.email, request.token)
+        user_id = await get_email_service().verify_password_reset_token(request.email, request.token)
         if not user_id:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -571,9 +580,10 @@ async def confirm_password_reset(request: ConfirmPasswordResetRequest):
                         ':updated': datetime.now(timezone.utc).isoformat()
                     }
                 )
+            user_service.invalidate_user_cache(user_id)
         
         # Mark token as used
-        await email_service.mark_password_reset_token_used(request.email, request.token)
+        await get_email_service().mark_password_reset_token_used(request.email, request.token)
         
         # Get updated user and generate tokens
         user = user_service._get_user_by_email(request.email)
@@ -597,7 +607,7 @@ async def confirm_password_reset(request: ConfirmPasswordResetRequest):
 async def verify_email(email: str, token: str):
     """Verify email address"""
     try:
-        is_verified = await email_service.verify_email_token(email, token)
+        is_verified = await get_email_service().verify_email_token(email, token)
         
         if is_verified:
             return {"message": "Email verified successfully. You can now set your password."}
@@ -642,17 +652,33 @@ async def get_current_user_info(current_user: Dict[str, Any] = Depends(get_curre
         }
     }
 
+@router.post("/auth/logout")
+async def logout(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: Dict[str, Any] = Depends(get_current_user)
+):
+    """Revoke the current access token"""
+    if not settings.is_local:
+        user_service.revoke_token(credentials.credentials)
+    return {"message": "Successfully logged out"}
+
 # Admin-only routes
 @router.get("/auth/users")
 async def get_all_users(
     page: int = 1,
     limit: int = 50,
+    cursor: Optional[str] = None,
     admin_user: Dict[str, Any] = Depends(require_admin)
 ):
     """Get all users (admin only)"""
     try:
-        result = await user_service.get_all_users(page, limit)
+        result = await user_service.get_all_users(page, limit, cursor)
         return result
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Error getting users: {e}")
         raise HTTPException(
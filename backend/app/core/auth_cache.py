@@ -0,0 +1,194 @@
+"""
+Two-tier authentication cache
+In-process TTL cache in front of Redis, keyed by user_id, plus a verified-token cache
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+import redis
+from cachetools import TLRUCache, TTLCache
+
+from .config import settings
+from .redis_client import SharedRedis, shared_redis
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAuthContext:
+    user: Any
+    password_hash: Optional[str]
+    cached_at: float
+
+
+class AuthCache:
+    """
+    Caches user accounts (and password hashes) for authenticated requests.
+    The local tier absorbs repeated lookups within a replica; Redis shares
+    entries across replicas. Both tiers expire after the same TTL.
+    """
+
+    def __init__(
+        self,
+        serialize_user: Callable[[Any], Dict[str, Any]],
+        deserialize_user: Callable[[Dict[str, Any]], Any],
+        ttl: Optional[int] = None,
+        maxsize: int = 10_000,
+        namespace: str = "auth:user",
+        redis_backend: SharedRedis = shared_redis
+    ):
+        self.ttl = ttl if ttl is not None else settings.auth_cache_user_ttl
+        self.namespace = namespace
+        self._serialize_user = serialize_user
+        self._deserialize_user = deserialize_user
+        self._redis = redis_backend
+        self._local: TTLCache = TTLCache(maxsize=maxsize, ttl=self.ttl)
+        # DB helpers call into the cache from executor threads
+        self._lock = threading.Lock()
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.namespace}:{user_id}"
+
+    def get(self, user_id: str) -> Optional[CachedAuthContext]:
+        """Return a cached context, checking the local tier before Redis"""
+        with self._lock:
+            context = self._local.get(user_id)
+        if context is None:
+            context = self._get_from_redis(user_id)
+            if context is None:
+                return None
+            with self._lock:
+                self._local[user_id] = context
+        # Callers mutate the returned account, so never hand out the cached instance
+        return CachedAuthContext(copy.copy(context.user), context.password_hash, context.cached_at)
+
+    def set(self, user_id: str, user: Any, password_hash: Optional[str]) -> CachedAuthContext:
+        """Populate both tiers and return the cached context"""
+        context = CachedAuthContext(user=user, password_hash=password_hash, cached_at=time.time())
+        with self._lock:
+            self._local[user_id] = context
+
+        client = self._redis.client
+        if client is not None:
+            payload = json.dumps({
+                'user': self._serialize_user(user),
+                'password_hash': password_hash,
+                'cached_at': context.cached_at
+            }, default=str)
+            try:
+                client.set(self._key(user_id), payload, ex=self.ttl)
+            except redis.RedisError as e:
+                self._redis.mark_unavailable(e)
+
+        return CachedAuthContext(copy.copy(user), password_hash, context.cached_at)
+
+    def invalidate(self, user_id: str):
+        """Drop a user from both tiers (password, status or lock changes)"""
+        with self._lock:
+            self._local.pop(user_id, None)
+
+        client = self._redis.client
+        if client is not None:
+            try:
+                client.delete(self._key(user_id))
+            except redis.RedisError as e:
+                self._redis.mark_unavailable(e)
+
+    def _get_from_redis(self, user_id: str) -> Optional[CachedAuthContext]:
+        client = self._redis.client
+        if client is None:
+            return None
+
+        try:
+            payload = client.get(self._key(user_id))
+        except redis.RedisError as e:
+            self._redis.mark_unavailable(e)
+            return None
+
+        if not payload:
+            return None
+
+        try:
+            data = json.loads(payload)
+            return CachedAuthContext(
+                user=self._deserialize_user(data['user']),
+                password_hash=data.get('password_hash'),
+                cached_at=data.get('cached_at', time.time())
+            )
+        except Exception as e:
+            logger.warning(f"Discarding unreadable auth cache entry for {user_id}: {e}")
+            return None
+
+
+class VerifiedTokenCache:
+    """
+    Remembers successfully decoded JWTs so repeat requests skip signature verification.
+    Entries live until the token expires or the revocation TTL elapses, whichever is sooner;
+    revocations go to Redis so other replicas reject the token on their next miss.
+    """
+
+    def __init__(
+        self,
+        revocation_ttl: Optional[int] = None,
+        maxsize: int = 50_000,
+        namespace: str = "auth:revoked",
+        redis_backend: SharedRedis = shared_redis
+    ):
+        self.revocation_ttl = revocation_ttl if revocation_ttl is not None else settings.auth_cache_revocation_ttl
+        self.namespace = namespace
+        self._redis = redis_backend
+        self._local: TLRUCache = TLRUCache(maxsize=maxsize, ttu=self._entry_expiry)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def _entry_expiry(self, digest: bytes, payload: Dict[str, Any], now: float) -> float:
+        remaining = payload.get('exp', 0) - time.time()
+        return now + max(0.0, min(remaining, self.revocation_ttl))
+
+    def _key(self, digest: bytes) -> str:
+        return f"{self.namespace}:{digest.hex()}"
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Return the cached payload for a previously verified token"""
+        with self._lock:
+            payload = self._local.get(self._digest(token))
+        return dict(payload) if payload is not None else None
+
+    def set(self, token: str, payload: Dict[str, Any]):
+        """Remember a verified payload (already-expired tokens are skipped by the cache)"""
+        with self._lock:
+            self._local[self._digest(token)] = dict(payload)
+
+    def is_revoked(self, token: str) -> bool:
+        client = self._redis.client
+        if client is None:
+            return False
+
+        try:
+            return bool(client.exists(self._key(self._digest(token))))
+        except redis.RedisError as e:
+            self._redis.mark_unavailable(e)
+            return False
+
+    def revoke(self, token: str, expires_at: int):
+        """Drop the token locally and mark it revoked until it would have expired"""
+        digest = self._digest(token)
+        with self._lock:
+            self._local.pop(digest, None)
+
+        client = self._redis.client
+        if client is not None:
+            try:
+                client.set(self._key(digest), 1, ex=max(1, expires_at - int(time.time())))
+            except redis.RedisError as e:
+                self._redis.mark_unavailable(e)
@@ -0,0 +1,61 @@
+"""
+Process-wide AWS session and clients
+Services share one boto3 session and its connection pools instead of building their own
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Dict
+
+import boto3
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Warm, pooled connections with fast failure; adaptive retries absorb throttling
+AWS_CLIENT_CONFIG = Config(
+    max_pool_connections=50,
+    tcp_keepalive=True,
+    retries={'mode': 'adaptive', 'max_attempts': 3},
+    connect_timeout=1,
+    read_timeout=3
+)
+
+_lock = threading.Lock()
+_session = None
+_clients: Dict[str, Any] = {}
+
+
+def get_session() -> boto3.Session:
+    """Return the shared session, created on first use (sessions are not safe to build concurrently)"""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.Session(region_name=os.getenv('AWS_REGION', 'us-east-1'))
+        return _session
+
+
+def _get_or_create(key: str, factory):
+    with _lock:
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+
+def get_dynamodb_resource():
+    """Shared DynamoDB resource"""
+    session = get_session()
+    return _get_or_create('dynamodb_resource', lambda: session.resource('dynamodb', config=AWS_CLIENT_CONFIG))
+
+
+def get_dynamodb_client():
+    """Shared low-level DynamoDB client"""
+    session = get_session()
+    return _get_or_create('dynamodb', lambda: session.client('dynamodb', config=AWS_CLIENT_CONFIG))
+
+
+def get_ses_client():
+    """Shared SES client"""
+    session = get_session()
+    return _get_or_create('ses', lambda: session.client('ses', config=AWS_CLIENT_CONFIG))
@@ -79,6 +79,10 @@ class Settings(BaseSettings):
     redis_port: int = 6379
     redis_password: Optional[str] = None
     
+    # Auth cache settings (seconds)
+    auth_cache_user_ttl: int = 60
+    auth_cache_revocation_ttl: int = 30
+    
     # Security settings
     jwt_secret_key: str = "dev-secret-key-change-in-production"
     access_token_expire_minutes: int = 30
@@ -0,0 +1,44 @@
+"""
+Shared Redis client for cross-replica caches
+Backs off after connection errors so callers can fall straight through to the database
+"""
+
+import logging
+import time
+from typing import Optional
+
+import redis
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SharedRedis:
+    """Lazily-connected Redis client that stays out of the way while Redis is unreachable"""
+
+    def __init__(self, url: str, password: Optional[str] = None, retry_after_seconds: float = 30.0):
+        self._client = redis.Redis.from_url(
+            url,
+            password=password or None,
+            socket_timeout=0.25,
+            socket_connect_timeout=0.25,
+            decode_responses=True
+        )
+        self._retry_after_seconds = retry_after_seconds
+        self._unavailable_until = 0.0
+
+    @property
+    def client(self) -> Optional[redis.Redis]:
+        """Return the client, or None while backing off after a failure"""
+        if time.monotonic() < self._unavailable_until:
+            return None
+        return self._client
+
+    def mark_unavailable(self, error: Exception):
+        """Skip Redis for a while after a connection or timeout error"""
+        logger.warning(f"Redis unavailable, bypassing for {self._retry_after_seconds:.0f}s: {error}")
+        self._unavailable_until = time.monotonic() + self._retry_after_seconds
+
+
+shared_redis = SharedRedis(settings.redis_url, settings.redis_password)
@@ -1,11 +1,13 @@
 import snowflake.connector
 import pandas as pd
+import pyarrow as pa
 from typing import Dict, Any, List, Optional
 from ..core.config import settings
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.serialization import load_pem_private_key
 import logging
 import os
+import threading
 import time
 from dotenv import load_dotenv
 
@@ -41,7 +43,8 @@ class SimpleSnowflakeConnection:
             'warehouse': settings.snowflake_warehouse,
             'database': settings.snowflake_database,
             'schema': settings.snowflake_schema,
-            'insecure_mode': True  # Skip SSL certificate validation
+            'insecure_mode': True,  # Skip SSL certificate validation
+            'client_session_keep_alive': True  # Keep the shared session from expiring between queries
         }
         
         # Add private key authentication if configured
@@ -56,6 +59,8 @@ class SimpleSnowflakeConnection:
             # Continue without private key - connection will fail gracefully
         
         self.connection = None
+        # Queries run from executor threads; only one of them should reconnect a dropped session
+        self._connection_lock = threading.Lock()
         
         # Schema and data caching
         self._schema_cache: Dict[str, Dict[str, Any]] = {}
@@ -167,6 +172,15 @@ class SimpleSnowflakeConnection:
             logger.error(f"Failed to initialize Snowflake connection: {str(e)}")
             raise
     
+    def _get_connection(self):
+        """Return the shared connection, reconnecting if it has been closed"""
+        if self.connection is None or self.connection.is_closed():
+            with self._connection_lock:
+                if self.connection is None or self.connection.is_closed():
+                    logger.info("Snowflake connection is closed, reconnecting")
+                    self._initialize_connection()
+        return self.connection
+    
     def _is_cache_valid(self) -> bool:
         """Check if cache is still valid"""
         return (time.time() - self._cache_timestamp) < self._cache_ttl
@@ -182,20 +196,24 @@ class SimpleSnowflakeConnection:
         """Update cache timestamp"""
         self._cache_timestamp = time.time()
     
+    def _apply_row_limit(self, query: str) -> str:
+        """Add LIMIT 200 if not present"""
+        query_upper = query.upper().strip()
+        if 'LIMIT' not in query_upper:
+            # Remove semicolon if present, add LIMIT, then add semicolon back
+            if query.strip().endswith(';'):
+                query = query.strip()[:-1] + ' LIMIT 200;'
+            else:
+                query += ' LIMIT 200'
+            logger.info("Added LIMIT 200 to query")
+        return query
+    
     def execute_query(self, query: str, params: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
         """Execute a query and return results as DataFrame with 200 row limit"""
         try:
-            # Add LIMIT 200 if not present
-            query_upper = query.upper().strip()
-            if 'LIMIT' not in query_upper:
-                # Remove semicolon if present, add LIMIT, then add semicolon back
-                if query.strip().endswith(';'):
-                    query = query.strip()[:-1] + ' LIMIT 200;'
-                else:
-                    query += ' LIMIT 200'
-                logger.info("Added LIMIT 200 to query")
+            query = self._apply_row_limit(query)
             
-            cursor = self.connection.cursor()
+            cursor = self._get_connection().cursor()
             
             if params:
                 cursor.execute(query, params)
@@ -219,6 +237,33 @@ class SimpleSnowflakeConnection:
             logger.error(f"Query execution failed: {str(e)}")
             raise
     
+    def execute_query_arrow(self, query: str, params: Optional[Dict[str, Any]] = None) -> pa.Table:
+        """Execute a query and return results as an Arrow table with 200 row limit"""
+        try:
+            query = self._apply_row_limit(query)
+            
+            cursor = self._get_connection().cursor()
+            try:
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                
+                # Result batches arrive as Arrow already, so skip building Python row tuples
+                table = cursor.fetch_arrow_all()
+                if table is None:
+                    # Empty results have no batches; keep the column names
+                    table = pa.table({desc[0]: pa.array([], type=pa.null()) for desc in cursor.description})
+            finally:
+                cursor.close()
+            
+            logger.info(f"Query executed successfully, returned {table.num_rows} rows")
+            return table
+            
+        except Exception as e:
+            logger.error(f"Query execution failed: {str(e)}")
+            raise
+    
     def get_available_tables(self) -> List[str]:
         """Get list of available tables - restricted to specific Worker Operations tables with caching"""
         # Check cache first
@@ -273,7 +318,7 @@ class SimpleSnowflakeConnection:
             query = f"DESCRIBE TABLE {self.connection_params['database']}.{self.connection_params['schema']}.{table_name}"
             
             # Execute query directly without adding LIMIT
-            cursor = self.connection.cursor()
+            cursor = self._get_connection().cursor()
             cursor.execute(query)
             columns = [desc[0] for desc in cursor.description]
             results = cursor.fetchall()
@@ -301,7 +346,7 @@ class SimpleSnowflakeConnection:
             # Fallback: try to get columns from a sample query
             try:
                 query = f"SELECT * FROM {self.connection_params['database']}.{self.connection_params['schema']}.{table_name} LIMIT 1"
-                cursor = self.connection.cursor()
+                cursor = self._get_connection().cursor()
                 cursor.execute(query)
                 columns = [desc[0] for desc in cursor.description]
                 results = cursor.fetchall()
@@ -390,7 +435,7 @@ class SimpleSnowflakeConnection:
     def test_connection(self) -> bool:
         """Test the connection"""
         try:
-            cursor = self.connection.cursor()
+            cursor = self._get_connection().cursor()
             cursor.execute("SELECT 1 as test")
             result = cursor.fetchone()
             cursor.close()
@@ -453,6 +498,8 @@ def get_snowflake_connection():
             class MockSnowflakeConnection:
                 def execute_query(self, *args, **kwargs):
                     raise Exception("Snowflake connection not available")
+                def execute_query_arrow(self, *args, **kwargs):
+                    raise Exception("Snowflake connection not available")
                 def close(self):
                     pass
             simple_snowflake_db = MockSnowflakeConnection()
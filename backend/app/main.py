@@ -1,6 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
 from .api import chat
 from .core.config import settings
 import logging
@@ -13,7 +13,9 @@ app = FastAPI(
     title=settings.app_name,
     version=settings.version,
     description="Business Intelligence Chatbot for Worker Operations",
-    debug=settings.debug
+    debug=settings.debug,
+    # Query results dominate response size; orjson encodes them far faster than the stdlib
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
@@ -40,6 +42,14 @@ app.include_router(confluence.router, prefix="/api/v1/confluence", tags=["conflu
 from .api import auth
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
 
+@app.on_event("shutdown")
+async def close_shared_clients():
+    """Flush queued chat history and close long-lived HTTP clients"""
+    from .services.bi_service import bi_service
+    from .services.confluence_service import confluence_service
+    await bi_service.flush_history_writes()
+    await confluence_service.aclose()
+
 @app.get("/")
 async def root():
     """Root endpoint - redirect to docs"""
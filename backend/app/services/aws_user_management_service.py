@@ -3,25 +3,75 @@ AWS-Ready User Management Service
 Production-ready user management with email verification, authentication, and multi-storage support
 """
 
+import asyncio
+import base64
+import hashlib
+import heapq
+import hmac
+import json
 import logging
+import secrets
+import threading
+import time
 import jwt
 import bcrypt
-import boto3
-from typing import Dict, List, Optional, Any, Union
+import orjson
+from typing import Dict, List, Optional, Any, Tuple, Union
 from datetime import datetime, timedelta, timezone
 from uuid import uuid4
 from pydantic import BaseModel, EmailStr
 import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from contextlib import contextmanager
 from dataclasses import dataclass, asdict
 from enum import Enum
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
 from botocore.exceptions import ClientError
+from cachetools import TTLCache
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
-from .email_verification_service import email_verification_service
+import redis
+from psycopg2.pool import ThreadedConnectionPool
+from ..core.auth_cache import AuthCache, CachedAuthContext, VerifiedTokenCache
+from ..core.aws_clients import get_dynamodb_client, get_dynamodb_resource
+from ..core.redis_client import shared_redis
+from .email_verification_service import get_email_verification_service
 
 logger = logging.getLogger(__name__)
 
+# Dedicated pool for bcrypt work so password hashing never runs on the event loop
+_bcrypt_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('BCRYPT_POOL_SIZE', str(os.cpu_count() or 4))),
+    thread_name_prefix='bcrypt'
+)
+
+# Second-granularity UTC clock for hot write paths: (epoch second or day, iso string)
+_now_iso_cache: Tuple[int, str] = (-1, '')
+_today_iso_cache: Tuple[int, str] = (-1, '')
+
+def _utc_now_iso() -> str:
+    """Current UTC time in ISO format, truncated to the second and reused within it"""
+    global _now_iso_cache
+    second = int(time.time())
+    cached_second, iso = _now_iso_cache
+    if cached_second != second:
+        iso = datetime.fromtimestamp(second, timezone.utc).isoformat()
+        _now_iso_cache = (second, iso)
+    return iso
+
+def _utc_today_iso() -> str:
+    """Current UTC date in ISO format, recomputed only when the day rolls over"""
+    global _today_iso_cache
+    day = int(time.time()) // 86400
+    cached_day, iso = _today_iso_cache
+    if cached_day != day:
+        iso = datetime.fromtimestamp(day * 86400, timezone.utc).date().isoformat()
+        _today_iso_cache = (day, iso)
+    return iso
+
 class UserRole(str, Enum):
     ADMIN = "admin"
     USER = "user"
@@ -38,7 +88,84 @@ class UserStatus(str, Enum):
     SUSPENDED = "suspended"
     LOCKED = "locked"
 
-@dataclass
+# Stored string -> enum lookups used when rehydrating users on every auth request
+_ROLE_BY_STR = {r.value: r for r in UserRole}
+_USAGE_PLAN_BY_STR = {p.value: p for p in UsagePlan}
+_STATUS_BY_STR = {s.value: s for s in UserStatus}
+
+# Fixed column order for user SELECTs; rows are unpacked positionally
+_USER_COLUMNS = """user_id, email, password_hash, role, usage_plan, status,
+                           is_email_verified, failed_login_attempts, locked_until,
+                           last_login, created_at, updated_at, metadata"""
+
+# Hot-path statements, PREPAREd once per pooled connection and run with EXECUTE name(...)
+_PREPARED_STATEMENTS = {
+    'login_fetch': f"SELECT {_USER_COLUMNS} FROM users WHERE lower(email) = lower($1)",
+    'user_by_id': f"SELECT {_USER_COLUMNS} FROM users WHERE user_id = $1",
+    'inc_fail': """
+        UPDATE users 
+        SET failed_login_attempts = failed_login_attempts + 1,
+            locked_until = CASE 
+                WHEN failed_login_attempts + 1 >= 5 
+                THEN CURRENT_TIMESTAMP + INTERVAL '30 minutes'
+                ELSE locked_until 
+            END
+        WHERE user_id = $1
+        RETURNING failed_login_attempts
+    """,
+    'reset_fail': """
+        UPDATE users 
+        SET failed_login_attempts = 0, locked_until = NULL, last_login = CURRENT_TIMESTAMP
+        WHERE user_id = $1
+        RETURNING last_login
+    """,
+    'usage_agg': """
+        SELECT
+            COALESCE(SUM(usage_count), 0),
+            COALESCE(SUM(usage_count) FILTER (WHERE usage_date = CURRENT_DATE), 0)
+        FROM user_usage 
+        WHERE user_id = $1 
+        AND usage_type = 'message' 
+        AND usage_date >= date_trunc('month', CURRENT_DATE)
+    """
+}
+
+class _PreparedConnection(psycopg2.extensions.connection):
+    """Pooled connection that remembers whether the hot-path statements are prepared on it"""
+    statements_prepared = False
+
+# Hot-path indexes, built CONCURRENTLY so existing deployments don't lock the tables
+_HOT_PATH_INDEXES = [
+    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS users_email_lower_idx ON users ((lower(email)))",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS user_usage_uuhot ON user_usage (user_id, usage_type, usage_date DESC) INCLUDE (usage_count)",
+    # Both keys descending so the listing's (created_at, user_id) row comparison and ORDER BY
+    # come straight off the index; replaces users_created_desc, whose ascending user_id could not
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS users_created_user_desc ON users (created_at DESC, user_id DESC)",
+    "DROP INDEX CONCURRENTLY IF EXISTS users_created_desc"
+]
+
+# DynamoDB admin listing: every user carries entity_type='user' so the GSI sorts them by created_at
+_USERS_BY_CREATED_AT_INDEX = 'UsersByCreatedAt'
+_USER_ENTITY_TYPE = 'user'
+_USER_COUNT_KEY = '#meta#user_count'
+_USER_LIST_ATTRIBUTES = ['email', 'role', 'usage_plan', 'status', 'is_email_verified', 'last_login']
+# Fallback listing when the index is missing or still backfilling
+_USER_SCAN_SEGMENTS = 8
+
+# Redis message counters are seeded from the DB aggregate and only incremented once present,
+# so a missing key always falls back to the database instead of under-counting.
+# The TTL cap bounds drift from increments that race with seeding.
+_USAGE_CACHE_MAX_TTL = 300
+_INCR_EXISTING_USAGE_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('INCRBY', key, ARGV[1])
+    end
+end
+return 0
+"""
+
+@dataclass(slots=True)
 class UsageLimits:
     monthly_messages: int
     daily_messages: int
@@ -46,7 +173,7 @@ class UsageLimits:
     model_access: List[str]
     advanced_features: bool = False
 
-@dataclass
+@dataclass(slots=True)
 class UserAccount:
     user_id: str
     email: str
@@ -104,6 +231,9 @@ class AWSUserManagementService:
         self.jwt_algorithm = 'HS256'
         self.access_token_expire_minutes = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES', '30'))
         self.refresh_token_expire_days = int(os.getenv('REFRESH_TOKEN_EXPIRE_DAYS', '7'))
+        self.refresh_token_pepper = (os.getenv('REFRESH_TOKEN_PEPPER') or self.jwt_secret).encode('utf-8')
+        # Verified against when the email is unknown so misses cost the same as wrong passwords
+        self._dummy_hash = self._hash_password(secrets.token_urlsafe(32))
         
         # Storage configuration
         self.storage_type = self._determine_storage_type(storage_type)
@@ -133,6 +263,13 @@ class AWSUserManagementService:
             )
         }
         
+        # user_id -> account + password hash, shared across replicas via Redis
+        self._auth_cache = AuthCache(
+            serialize_user=self._user_to_item,
+            deserialize_user=self._item_to_user_account
+        )
+        self._token_cache = VerifiedTokenCache()
+        
         # Initialize storage backend
         if self.storage_type == "postgresql":
             self._init_postgresql()
@@ -160,9 +297,25 @@ class AWSUserManagementService:
         }
         
         try:
+            # Parse JSON/JSONB values (user metadata, row_to_json pages) with orjson instead of the stdlib decoder
+            psycopg2.extras.register_default_json(loads=orjson.loads, globally=True)
+            psycopg2.extras.register_default_jsonb(loads=orjson.loads, globally=True)
+            
+            # Connections are rented from a shared pool instead of opened per call
+            self._pg_statements_ready = False
+            self._pg_pool = ThreadedConnectionPool(
+                minconn=int(os.getenv('RDS_POOL_MIN_CONNECTIONS', '2')),
+                maxconn=int(os.getenv('RDS_POOL_MAX_CONNECTIONS', '32')),
+                connection_factory=_PreparedConnection,
+                **self.db_config
+            )
+            
             # Test connection and create tables
             with self._get_db_connection() as conn:
                 self._create_postgresql_tables(conn)
+                self._create_postgresql_indexes(conn)
+            # Statements can only be prepared once the tables exist
+            self._pg_statements_ready = True
             logger.info("PostgreSQL backend initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize PostgreSQL: {e}")
@@ -175,8 +328,19 @@ class AWSUserManagementService:
         """Initialize DynamoDB connection"""
         try:
             self.aws_region = os.getenv('AWS_REGION', 'us-east-1')
-            session = boto3.Session(region_name=self.aws_region)
-            self.dynamodb = session.resource('dynamodb')
+            
+            # Process-wide session and pooled, keep-alive connections shared with the other services
+            self.dynamodb = get_dynamodb_resource()
+            
+            # Low-level client for hot-path reads (skips resource wrapper overhead)
+            self._ddb_client = get_dynamodb_client()
+            self._ddb_serializer = TypeSerializer()
+            self._ddb_deserializer = TypeDeserializer()
+            
+            # email -> user_id; lets writes keyed by email skip the GSI query
+            # Bounded so a long-lived worker does not grow it with every email it has seen
+            self._email_id_cache: TTLCache = TTLCache(maxsize=10000, ttl=3600)
+            self._email_id_lock = threading.Lock()
             
             # Table names
             self.users_table_name = os.getenv('USERS_TABLE', 'wops-users')
@@ -192,23 +356,35 @@ class AWSUserManagementService:
     
     @contextmanager
     def _get_db_connection(self):
-        """Context manager for PostgreSQL connections"""
+        """Context manager that rents a PostgreSQL connection from the pool"""
         if self.storage_type != "postgresql":
             raise RuntimeError("Not using PostgreSQL backend")
         
-        conn = None
+        conn = self._pg_pool.getconn()
         try:
-            conn = psycopg2.connect(**self.db_config)
-            conn.set_session(autocommit=False)
+            if self._pg_statements_ready and not conn.statements_prepared:
+                self._prepare_statements(conn)
             yield conn
         except Exception as e:
-            if conn:
+            if not conn.closed:
                 conn.rollback()
             logger.error(f"Database error: {e}")
             raise
         finally:
-            if conn:
-                conn.close()
+            if conn.closed:
+                self._pg_pool.putconn(conn, close=True)
+            else:
+                # End any read-only transaction so the connection goes back idle
+                conn.rollback()
+                self._pg_pool.putconn(conn)
+    
+    def _prepare_statements(self, conn):
+        """PREPARE the hot-path statements on a freshly opened connection"""
+        with conn.cursor() as cursor:
+            for name, statement in _PREPARED_STATEMENTS.items():
+                cursor.execute(f"PREPARE {name} AS {statement}")
+        conn.commit()
+        conn.statements_prepared = True
     
     def _create_postgresql_tables(self, conn):
         """Create PostgreSQL tables"""
@@ -264,6 +440,7 @@ class AWSUserManagementService:
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_status ON users(status);")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_usage_user_date ON user_usage(user_id, usage_date);")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user ON refresh_tokens(user_id);")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_refresh_tokens_hash ON refresh_tokens(token_hash);")
         
         # Update trigger for updated_at
         cursor.execute("""
@@ -287,6 +464,19 @@ class AWSUserManagementService:
         conn.commit()
         logger.info("PostgreSQL tables created successfully")
     
+    def _create_postgresql_indexes(self, conn):
+        """Create hot-path indexes (CREATE INDEX CONCURRENTLY cannot run inside a transaction)"""
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                for statement in _HOT_PATH_INDEXES:
+                    try:
+                        cursor.execute(statement)
+                    except psycopg2.Error as e:
+                        logger.warning(f"Could not create index ({statement}): {e}")
+        finally:
+            conn.autocommit = False
+    
     def _create_dynamodb_tables(self):
         """Create DynamoDB tables"""
         try:
@@ -303,7 +493,9 @@ class AWSUserManagementService:
                         ],
                         AttributeDefinitions=[
                             {'AttributeName': 'user_id', 'AttributeType': 'S'},
-                            {'AttributeName': 'email', 'AttributeType': 'S'}
+                            {'AttributeName': 'email', 'AttributeType': 'S'},
+                            {'AttributeName': 'entity_type', 'AttributeType': 'S'},
+                            {'AttributeName': 'created_at', 'AttributeType': 'S'}
                         ],
                         BillingMode='PAY_PER_REQUEST',
                         GlobalSecondaryIndexes=[
@@ -313,10 +505,13 @@ class AWSUserManagementService:
                                     {'AttributeName': 'email', 'KeyType': 'HASH'}
                                 ],
                                 'Projection': {'ProjectionType': 'ALL'}
-                            }
+                            },
+                            self._users_by_created_at_index_spec()
                         ]
                     )
                     self.users_table.wait_until_exists()
+            else:
+                self._ensure_users_by_created_at_index()
             
             # Usage table
             try:
@@ -369,6 +564,72 @@ class AWSUserManagementService:
             logger.error(f"Failed to create DynamoDB tables: {e}")
             raise
     
+    def _users_by_created_at_index_spec(self) -> Dict[str, Any]:
+        """GSI definition used for server-side paginated admin listing"""
+        return {
+            'IndexName': _USERS_BY_CREATED_AT_INDEX,
+            'KeySchema': [
+                {'AttributeName': 'entity_type', 'KeyType': 'HASH'},
+                {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+            ],
+            'Projection': {
+                'ProjectionType': 'INCLUDE',
+                'NonKeyAttributes': _USER_LIST_ATTRIBUTES
+            }
+        }
+    
+    def _ensure_users_by_created_at_index(self):
+        """Add the listing GSI to a pre-existing users table"""
+        existing = {index['IndexName'] for index in (self.users_table.global_secondary_indexes or [])}
+        if _USERS_BY_CREATED_AT_INDEX in existing:
+            return
+        
+        try:
+            self.users_table.update(
+                AttributeDefinitions=[
+                    {'AttributeName': 'entity_type', 'AttributeType': 'S'},
+                    {'AttributeName': 'created_at', 'AttributeType': 'S'}
+                ],
+                GlobalSecondaryIndexUpdates=[{'Create': self._users_by_created_at_index_spec()}]
+            )
+            logger.info(f"Created {_USERS_BY_CREATED_AT_INDEX} index; run bootstrap_user_listing to backfill it")
+        except ClientError as e:
+            # Another replica may already be creating it
+            logger.warning(f"Could not create {_USERS_BY_CREATED_AT_INDEX} index: {e}")
+    
+    def bootstrap_user_listing(self) -> int:
+        """One-off step: tag existing users with entity_type and seed the user counter.
+        
+        Idempotent, and needed whoever created the listing index (this service or Terraform).
+        Run while registrations are quiet: the seed overwrites concurrent counter increments.
+        """
+        if self.storage_type != "dynamodb":
+            raise RuntimeError("bootstrap_user_listing only applies to the DynamoDB backend")
+        
+        user_count = 0
+        tagged = 0
+        scan_kwargs = {'ProjectionExpression': 'user_id, entity_type'}
+        while True:
+            response = self.users_table.scan(**scan_kwargs)
+            for item in response['Items']:
+                if item['user_id'] == _USER_COUNT_KEY:
+                    continue
+                user_count += 1
+                if item.get('entity_type') != _USER_ENTITY_TYPE:
+                    self.users_table.update_item(
+                        Key={'user_id': item['user_id']},
+                        UpdateExpression='SET entity_type = :et',
+                        ExpressionAttributeValues={':et': _USER_ENTITY_TYPE}
+                    )
+                    tagged += 1
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        
+        self.users_table.put_item(Item={'user_id': _USER_COUNT_KEY, 'user_count': user_count})
+        logger.info(f"Seeded user counter with {user_count} users; tagged {tagged} for {_USERS_BY_CREATED_AT_INDEX}")
+        return user_count
+    
     def _create_default_admin(self):
         """Create default admin user if it doesn't exist"""
         admin_email = os.getenv('ADMIN_EMAIL', 'admin@wops-ai.com')
@@ -462,144 +723,174 @@ class AWSUserManagementService:
     def _store_user_postgresql(self, user: UserAccount, password_hash: Optional[str] = None):
         """Store user in PostgreSQL"""
         with self._get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO users (
-                    user_id, email, password_hash, role, usage_plan, status,
-                    is_email_verified, created_at, updated_at, metadata
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                user.user_id, user.email, password_hash, user.role.value,
-                user.usage_plan.value, user.status.value, user.is_email_verified,
-                user.created_at, user.updated_at, psycopg2.extras.Json(user.metadata or {})
-            ))
-            conn.commit()
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO users (
+                        user_id, email, password_hash, role, usage_plan, status,
+                        is_email_verified, created_at, updated_at, metadata
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (
+                    user.user_id, user.email, password_hash, user.role.value,
+                    user.usage_plan.value, user.status.value, user.is_email_verified,
+                    user.created_at, user.updated_at, psycopg2.extras.Json(user.metadata or {})
+                ))
+                conn.commit()
     
-    def _store_user_dynamodb(self, user: UserAccount, password_hash: Optional[str] = None):
-        """Store user in DynamoDB"""
-        item = {
+    def _user_to_item(self, user: UserAccount) -> Dict[str, Any]:
+        """Convert UserAccount to a DynamoDB-style item of plain values"""
+        return {
             'user_id': user.user_id,
             'email': user.email,
             'role': user.role.value,
             'usage_plan': user.usage_plan.value,
             'status': user.status.value,
             'is_email_verified': user.is_email_verified,
-            'failed_login_attempts': user.failed_login_attempts,
+            'failed_login_attempts': int(user.failed_login_attempts or 0),
             'created_at': user.created_at.isoformat() if user.created_at else None,
             'updated_at': user.updated_at.isoformat() if user.updated_at else None,
             'last_login': user.last_login.isoformat() if user.last_login else None,
             'locked_until': user.locked_until.isoformat() if user.locked_until else None,
             'metadata': user.metadata or {}
         }
+    
+    def _store_user_dynamodb(self, user: UserAccount, password_hash: Optional[str] = None):
+        """Store user in DynamoDB"""
+        item = self._user_to_item(user)
         
+        item['entity_type'] = _USER_ENTITY_TYPE
         if password_hash:
             item['password_hash'] = password_hash
         
         self.users_table.put_item(Item=item)
+        with self._email_id_lock:
+            self._email_id_cache[user.email] = user.user_id
+        
+        # Maintained counter so admin listings never scan for a total
+        self.users_table.update_item(
+            Key={'user_id': _USER_COUNT_KEY},
+            UpdateExpression='ADD user_count :one',
+            ExpressionAttributeValues={':one': 1}
+        )
     
     def _get_user_by_email(self, email: str) -> Optional[UserAccount]:
         """Get user by email"""
+        loaded = self._get_auth_context_batched_sync(email)
+        return loaded[0] if loaded else None
+    
+    def _get_auth_context_batched_sync(self, email: str) -> Optional[Tuple[UserAccount, Optional[str]]]:
+        """Get user and password hash by email in a single round-trip"""
         if self.storage_type == "postgresql":
             return self._get_user_by_email_postgresql(email)
         elif self.storage_type == "dynamodb":
             return self._get_user_by_email_dynamodb(email)
+        return None
     
-    def _get_user_by_email_postgresql(self, email: str) -> Optional[UserAccount]:
-        """Get user by email from PostgreSQL"""
+    def _get_user_by_email_postgresql(self, email: str) -> Optional[Tuple[UserAccount, Optional[str]]]:
+        """Get user and password hash by email from PostgreSQL"""
         try:
             with self._get_db_connection() as conn:
-                cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-                cursor.execute("""
-                    SELECT user_id, email, password_hash, role, usage_plan, status,
-                           is_email_verified, failed_login_attempts, locked_until,
-                           last_login, created_at, updated_at, metadata
-                    FROM users WHERE email = %s
-                """, (email,))
-                
-                row = cursor.fetchone()
-                if not row:
-                    return None
-                
-                return self._row_to_user_account(row)
+                with conn.cursor() as cursor:
+                    cursor.execute("EXECUTE login_fetch(%s)", (email,))
+                    
+                    row = cursor.fetchone()
+                    if not row:
+                        return None
+                    
+                    return self._row_to_user_account_tuple(row), row[2]
         except Exception as e:
             logger.error(f"Error getting user by email from PostgreSQL: {e}")
             return None
     
-    def _get_user_by_email_dynamodb(self, email: str) -> Optional[UserAccount]:
-        """Get user by email from DynamoDB"""
+    def _get_user_by_email_dynamodb(self, email: str) -> Optional[Tuple[UserAccount, Optional[str]]]:
+        """Get user and password hash by email from DynamoDB (email-index projects ALL)"""
         try:
-            response = self.users_table.query(
+            response = self._ddb_client.query(
+                TableName=self.users_table_name,
                 IndexName='email-index',
                 KeyConditionExpression='email = :email',
-                ExpressionAttributeValues={':email': email}
+                ExpressionAttributeValues={':email': self._ddb_serializer.serialize(email)}
             )
             
             if not response['Items']:
                 return None
             
-            return self._item_to_user_account(response['Items'][0])
+            item = self._deserialize_item(response['Items'][0])
+            user = self._item_to_user_account(item)
+            with self._email_id_lock:
+                self._email_id_cache[email] = user.user_id
+            return user, item.get('password_hash')
         except Exception as e:
             logger.error(f"Error getting user by email from DynamoDB: {e}")
             return None
     
-    def _row_to_user_account(self, row) -> UserAccount:
-        """Convert database row to UserAccount"""
+    def _row_to_user_account_tuple(self, row) -> UserAccount:
+        """Convert a positional database row (see _USER_COLUMNS) to UserAccount"""
+        (user_id, email, _password_hash, role, usage_plan, status, is_email_verified,
+         failed_login_attempts, locked_until, last_login, created_at, updated_at, metadata) = row
+        usage_plan = _USAGE_PLAN_BY_STR[usage_plan]
         return UserAccount(
-            user_id=str(row['user_id']),
-            email=row['email'],
-            role=UserRole(row['role']),
-            usage_plan=UsagePlan(row['usage_plan']),
-            status=UserStatus(row['status']),
-            is_email_verified=row['is_email_verified'],
-            failed_login_attempts=row['failed_login_attempts'],
-            locked_until=row['locked_until'],
-            last_login=row['last_login'],
-            created_at=row['created_at'],
-            updated_at=row['updated_at'],
-            usage_limits=self.usage_plans[UsagePlan(row['usage_plan'])],
+            user_id=str(user_id),
+            email=email,
+            role=_ROLE_BY_STR[role],
+            usage_plan=usage_plan,
+            status=_STATUS_BY_STR[status],
+            is_email_verified=is_email_verified,
+            failed_login_attempts=failed_login_attempts,
+            locked_until=locked_until,
+            last_login=last_login,
+            created_at=created_at,
+            updated_at=updated_at,
+            usage_limits=self.usage_plans[usage_plan],
             current_usage={},  # To be loaded separately
-            metadata=row['metadata'] or {}
+            metadata=metadata or {}
         )
     
     def _item_to_user_account(self, item) -> UserAccount:
         """Convert DynamoDB item to UserAccount"""
+        usage_plan = _USAGE_PLAN_BY_STR[item['usage_plan']]
         return UserAccount(
             user_id=item['user_id'],
             email=item['email'],
-            role=UserRole(item['role']),
-            usage_plan=UsagePlan(item['usage_plan']),
-            status=UserStatus(item['status']),
+            role=_ROLE_BY_STR[item['role']],
+            usage_plan=usage_plan,
+            status=_STATUS_BY_STR[item['status']],
             is_email_verified=item.get('is_email_verified', False),
             failed_login_attempts=item.get('failed_login_attempts', 0),
             locked_until=datetime.fromisoformat(item['locked_until']) if item.get('locked_until') else None,
             last_login=datetime.fromisoformat(item['last_login']) if item.get('last_login') else None,
             created_at=datetime.fromisoformat(item['created_at']) if item.get('created_at') else None,
             updated_at=datetime.fromisoformat(item['updated_at']) if item.get('updated_at') else None,
-            usage_limits=self.usage_plans[UsagePlan(item['usage_plan'])],
+            usage_limits=self.usage_plans[usage_plan],
             current_usage={},  # To be loaded separately
             metadata=item.get('metadata', {})
         )
     
+    def _deserialize_item(self, item) -> Dict[str, Any]:
+        """Convert a low-level DynamoDB item into plain Python values"""
+        return {key: self._ddb_deserializer.deserialize(value) for key, value in item.items()}
+    
+    def _refresh_token_lookup_hash(self, refresh_token: str) -> str:
+        """Keyed, deterministic hash of a refresh token so it can be looked up directly"""
+        return hmac.new(self.refresh_token_pepper, refresh_token.encode('utf-8'), hashlib.sha256).hexdigest()
+    
     def _store_refresh_token(self, user_id: str, refresh_token: str):
         """Store refresh token"""
-        token_hash = bcrypt.hashpw(refresh_token.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        token_hash = self._refresh_token_lookup_hash(refresh_token)
         expires_at = datetime.now(timezone.utc) + timedelta(days=self.refresh_token_expire_days)
-        token_id = str(uuid4())
         
         if self.storage_type == "postgresql":
             with self._get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO refresh_tokens (user_id, token_hash, expires_at)
-                    VALUES (%s, %s, %s)
-                """, (user_id, token_hash, expires_at))
-                conn.commit()
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        INSERT INTO refresh_tokens (user_id, token_hash, expires_at)
+                        VALUES (%s, %s, %s)
+                    """, (user_id, token_hash, expires_at))
+                    conn.commit()
         elif self.storage_type == "dynamodb":
             self.tokens_table.put_item(
                 Item={
                     'user_id': user_id,
-                    'token_id': token_id,
-                    'token_hash': token_hash,
+                    'token_id': token_hash,
                     'expires_at': int(expires_at.timestamp()),
                     'created_at': datetime.now(timezone.utc).isoformat(),
                     'is_revoked': False
@@ -616,7 +907,7 @@ class AWSUserManagementService:
             if existing_user:
                 if existing_user.status == UserStatus.PENDING_VERIFICATION:
                     # Resend verification email
-                    await email_verification_service.send_verification_email(
+                    await get_email_verification_service().send_verification_email(
                         request.email, existing_user.user_id
                     )
                     return {
@@ -645,7 +936,7 @@ class AWSUserManagementService:
             self._store_user(user)
             
             # Send verification email
-            email_sent = await email_verification_service.send_verification_email(
+            email_sent = await get_email_verification_service().send_verification_email(
                 request.email, user.user_id
             )
             
@@ -667,64 +958,122 @@ class AWSUserManagementService:
         """Set password after email verification"""
         try:
             # Verify email token
-            is_verified = await email_verification_service.verify_email_token(
+            is_verified = await get_email_verification_service().verify_email_token(
                 request.email, request.verification_token
             )
             
             if not is_verified:
                 raise ValueError("Invalid or expired verification token")
             
-            # Get user
-            user = self._get_user_by_email(request.email)
-            if not user:
-                raise ValueError("User not found")
+            loop = asyncio.get_running_loop()
             
-            # Hash password and update user
-            password_hash = self._hash_password(request.password)
+            # Hash the password off the event loop while the user lookup runs
+            hash_future = loop.run_in_executor(_bcrypt_pool, self._hash_password, request.password)
             
-            # Update user status and verification
-            if self.storage_type == "postgresql":
-                with self._get_db_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        UPDATE users 
-                        SET password_hash = %s, status = %s, is_email_verified = %s, updated_at = CURRENT_TIMESTAMP
-                        WHERE email = %s
-                    """, (password_hash, UserStatus.ACTIVE.value, True, request.email))
-                    conn.commit()
-            elif self.storage_type == "dynamodb":
-                self.users_table.update_item(
-                    Key={'user_id': user.user_id},
-                    UpdateExpression='SET password_hash = :ph, #status = :status, is_email_verified = :verified, updated_at = :updated',
-                    ExpressionAttributeNames={'#status': 'status'},
-                    ExpressionAttributeValues={
-                        ':ph': password_hash,
-                        ':status': UserStatus.ACTIVE.value,
-                        ':verified': True,
-                        ':updated': datetime.now(timezone.utc).isoformat()
-                    }
+            cached_user_id = None
+            if self.storage_type == "dynamodb":
+                with self._email_id_lock:
+                    cached_user_id = self._email_id_cache.get(request.email)
+            if cached_user_id:
+                # user_id is already known, so one UpdateItem both writes and returns the user
+                password_hash = await hash_future
+                user = await loop.run_in_executor(
+                    None, self._activate_dynamodb_user, request.email, cached_user_id, password_hash
+                )
+                tokens = await loop.run_in_executor(None, self._generate_tokens, user)
+            else:
+                # Get user
+                user = await loop.run_in_executor(None, self._get_user_by_email, request.email)
+                if not user:
+                    hash_future.cancel()
+                    raise ValueError("User not found")
+                
+                password_hash = await hash_future
+                
+                # Update user object
+                user.status = UserStatus.ACTIVE
+                user.is_email_verified = True
+                
+                # Persisting the password and issuing tokens are independent, so overlap them
+                _, tokens = await asyncio.gather(
+                    loop.run_in_executor(None, self._activate_user_with_password, user, password_hash),
+                    loop.run_in_executor(None, self._generate_tokens, user)
                 )
-            
-            # Update user object
-            user.status = UserStatus.ACTIVE
-            user.is_email_verified = True
             
             logger.info(f"Password set successfully for user: {request.email}")
-            return self._generate_tokens(user)
+            return tokens
             
         except Exception as e:
             logger.error(f"Set password error: {e}")
             raise
     
+    def _activate_user_with_password(self, user: UserAccount, password_hash: str):
+        """Store the password hash and mark the user as active and verified"""
+        if self.storage_type == "postgresql":
+            with self._get_db_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        UPDATE users 
+                        SET password_hash = %s, status = %s, is_email_verified = %s, updated_at = CURRENT_TIMESTAMP
+                        WHERE email = %s
+                    """, (password_hash, UserStatus.ACTIVE.value, True, user.email))
+                    conn.commit()
+        elif self.storage_type == "dynamodb":
+            self.users_table.update_item(
+                Key={'user_id': user.user_id},
+                UpdateExpression='SET password_hash = :ph, #status = :status, is_email_verified = :verified, updated_at = :updated',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':ph': password_hash,
+                    ':status': UserStatus.ACTIVE.value,
+                    ':verified': True,
+                    ':updated': _utc_now_iso()
+                }
+            )
+        
+        self._auth_cache.invalidate(user.user_id)
+    
+    def _activate_dynamodb_user(self, email: str, user_id: str, password_hash: str) -> UserAccount:
+        """Activate a DynamoDB user by primary key and return the updated account"""
+        try:
+            response = self.users_table.update_item(
+                Key={'user_id': user_id},
+                UpdateExpression='SET password_hash = :ph, #status = :status, is_email_verified = :verified, updated_at = :updated',
+                ConditionExpression='attribute_exists(user_id) AND email = :email',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={
+                    ':ph': password_hash,
+                    ':status': UserStatus.ACTIVE.value,
+                    ':verified': True,
+                    ':updated': _utc_now_iso(),
+                    ':email': email
+                },
+                ReturnValues='ALL_NEW'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                with self._email_id_lock:
+                    self._email_id_cache.pop(email, None)
+                raise ValueError("User not found")
+            raise
+        
+        self._auth_cache.invalidate(user_id)
+        return self._item_to_user_account(response['Attributes'])
+    
     async def login_user(self, request: LoginRequest) -> TokenResponse:
         """Authenticate user and return tokens"""
         try:
-            user = self._get_user_by_email(request.email)
-            if not user:
+            loop = asyncio.get_running_loop()
+            
+            # User row and password hash come back from one query, run off the event loop
+            loaded = await asyncio.to_thread(self._get_auth_context_batched_sync, request.email)
+            if not loaded:
+                # Spend the same bcrypt time as a real rejection so unknown emails can't be timed
+                await loop.run_in_executor(_bcrypt_pool, self._verify_password, request.password, self._dummy_hash)
                 raise ValueError("Invalid credentials")
+            user, password_hash = loaded
             
             # Check if user has a password set
-            password_hash = self._get_user_password_hash(user.user_id)
             if not password_hash:
                 raise ValueError("Please complete account setup by setting your password")
             
@@ -737,14 +1086,14 @@ class AWSUserManagementService:
                 if user.locked_until and datetime.now(timezone.utc) < user.locked_until:
                     raise ValueError("Account is temporarily locked")
             
-            # Verify password
-            if not self._verify_password(request.password, password_hash):
+            # Verify password off the event loop
+            if not await loop.run_in_executor(_bcrypt_pool, self._verify_password, request.password, password_hash):
                 # Increment failed attempts
-                self._increment_failed_attempts(user.user_id)
+                await asyncio.to_thread(self._increment_failed_attempts, user.user_id)
                 raise ValueError("Invalid credentials")
             
             # Reset failed attempts and update last login
-            self._reset_failed_attempts(user.user_id)
+            user.last_login = await asyncio.to_thread(self._reset_failed_attempts, user.user_id)
             
             logger.info(f"User logged in: {request.email}")
             return self._generate_tokens(user)
@@ -753,134 +1102,173 @@ class AWSUserManagementService:
             logger.error(f"Login error: {e}")
             raise
     
-    def _get_user_password_hash(self, user_id: str) -> Optional[str]:
-        """Get user password hash"""
+    def _increment_failed_attempts(self, user_id: str) -> int:
+        """Atomically increment failed login attempts and return the new count"""
         if self.storage_type == "postgresql":
             with self._get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT password_hash FROM users WHERE user_id = %s", (user_id,))
-                result = cursor.fetchone()
-                return result[0] if result else None
-        elif self.storage_type == "dynamodb":
-            response = self.users_table.get_item(Key={'user_id': user_id})
-            return response.get('Item', {}).get('password_hash')
-    
-    def _increment_failed_attempts(self, user_id: str):
-        """Increment failed login attempts"""
-        if self.storage_type == "postgresql":
-            with self._get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    UPDATE users 
-                    SET failed_login_attempts = failed_login_attempts + 1,
-                        locked_until = CASE 
-                            WHEN failed_login_attempts + 1 >= 5 
-                            THEN CURRENT_TIMESTAMP + INTERVAL '30 minutes'
-                            ELSE locked_until 
-                        END
-                    WHERE user_id = %s
-                """, (user_id,))
-                conn.commit()
+                with conn.cursor() as cursor:
+                    cursor.execute("EXECUTE inc_fail(%s)", (user_id,))
+                    row = cursor.fetchone()
+                    conn.commit()
+                    self._auth_cache.invalidate(user_id)
+                    return row[0] if row else 0
         elif self.storage_type == "dynamodb":
-            # Get current attempts
-            response = self.users_table.get_item(Key={'user_id': user_id})
-            current_attempts = response.get('Item', {}).get('failed_login_attempts', 0)
-            new_attempts = current_attempts + 1
-            
-            update_expr = 'SET failed_login_attempts = :attempts'
-            expr_values = {':attempts': new_attempts}
-            
-            if new_attempts >= 5:
-                locked_until = datetime.now(timezone.utc) + timedelta(minutes=30)
-                update_expr += ', locked_until = :locked'
-                expr_values[':locked'] = locked_until.isoformat()
-            
-            self.users_table.update_item(
+            # ADD is atomic, so concurrent failures cannot lose increments
+            response = self.users_table.update_item(
                 Key={'user_id': user_id},
-                UpdateExpression=update_expr,
-                ExpressionAttributeValues=expr_values
+                UpdateExpression='ADD failed_login_attempts :one',
+                ExpressionAttributeValues={':one': 1},
+                ReturnValues='ALL_NEW'
             )
+            attempts = int(response['Attributes'].get('failed_login_attempts', 0))
+            
+            if attempts >= 5:
+                now = datetime.now(timezone.utc)
+                try:
+                    # Only the first request to cross the threshold sets the lock window
+                    self.users_table.update_item(
+                        Key={'user_id': user_id},
+                        UpdateExpression='SET locked_until = :locked',
+                        ConditionExpression='attribute_not_exists(locked_until) OR locked_until < :now',
+                        ExpressionAttributeValues={
+                            ':locked': (now + timedelta(minutes=30)).isoformat(),
+                            ':now': now.isoformat()
+                        }
+                    )
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise
+            
+            self._auth_cache.invalidate(user_id)
+            return attempts
+        return 0
     
-    def _reset_failed_attempts(self, user_id: str):
-        """Reset failed login attempts"""
+    def _reset_failed_attempts(self, user_id: str) -> Optional[datetime]:
+        """Reset failed login attempts and return the new last_login"""
+        last_login = None
         if self.storage_type == "postgresql":
             with self._get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    UPDATE users 
-                    SET failed_login_attempts = 0, locked_until = NULL, last_login = CURRENT_TIMESTAMP
-                    WHERE user_id = %s
-                """, (user_id,))
-                conn.commit()
+                with conn.cursor() as cursor:
+                    cursor.execute("EXECUTE reset_fail(%s)", (user_id,))
+                    row = cursor.fetchone()
+                    conn.commit()
+                    last_login = row[0] if row else None
         elif self.storage_type == "dynamodb":
+            last_login = datetime.now(timezone.utc)
             self.users_table.update_item(
                 Key={'user_id': user_id},
                 UpdateExpression='SET failed_login_attempts = :zero, last_login = :login REMOVE locked_until',
                 ExpressionAttributeValues={
                     ':zero': 0,
-                    ':login': datetime.now(timezone.utc).isoformat()
+                    ':login': last_login.isoformat()
                 }
             )
+        
+        self._auth_cache.invalidate(user_id)
+        return last_login
     
     def verify_token(self, token: str) -> Dict[str, Any]:
         """Verify and decode JWT token"""
+        payload = self._token_cache.get(token)
+        if payload is not None:
+            return payload
+        
         try:
             payload = jwt.decode(token, self.jwt_secret, algorithms=[self.jwt_algorithm])
-            return payload
         except jwt.ExpiredSignatureError:
             raise ValueError("Token has expired")
         except jwt.InvalidTokenError:
             raise ValueError("Invalid token")
+        
+        if self._token_cache.is_revoked(token):
+            raise ValueError("Token has been revoked")
+        
+        self._token_cache.set(token, payload)
+        return payload
+    
+    def revoke_token(self, token: str):
+        """Reject a token from now until it expires (logout)"""
+        payload = self.verify_token(token)
+        self._token_cache.revoke(token, payload['exp'])
     
     def _get_user_by_id(self, user_id: str) -> Optional[UserAccount]:
         """Get user by ID"""
+        context = self._get_auth_context_by_id(user_id)
+        return context.user if context else None
+    
+    def _get_auth_context_by_id(self, user_id: str) -> Optional[CachedAuthContext]:
+        """Get user and password hash by ID, served from the auth cache when possible"""
+        context = self._auth_cache.get(user_id)
+        if context:
+            return context
+        
         if self.storage_type == "postgresql":
-            return self._get_user_by_id_postgresql(user_id)
+            loaded = self._get_user_by_id_postgresql(user_id)
         elif self.storage_type == "dynamodb":
-            return self._get_user_by_id_dynamodb(user_id)
+            loaded = self._get_user_by_id_dynamodb(user_id)
+        else:
+            loaded = None
+        
+        if not loaded:
+            return None
+        
+        user, password_hash = loaded
+        return self._auth_cache.set(user_id, user, password_hash)
+    
+    def invalidate_user_cache(self, user_id: str):
+        """Drop cached auth state after an out-of-band user update"""
+        self._auth_cache.invalidate(user_id)
     
-    def _get_user_by_id_postgresql(self, user_id: str) -> Optional[UserAccount]:
-        """Get user by ID from PostgreSQL"""
+    def _get_user_by_id_postgresql(self, user_id: str) -> Optional[Tuple[UserAccount, Optional[str]]]:
+        """Get user and password hash by ID from PostgreSQL"""
         try:
             with self._get_db_connection() as conn:
-                cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-                cursor.execute("""
-                    SELECT user_id, email, password_hash, role, usage_plan, status,
-                           is_email_verified, failed_login_attempts, locked_until,
-                           last_login, created_at, updated_at, metadata
-                    FROM users WHERE user_id = %s
-                """, (user_id,))
-                
-                row = cursor.fetchone()
-                if not row:
-                    return None
-                
-                return self._row_to_user_account(row)
+                with conn.cursor() as cursor:
+                    cursor.execute("EXECUTE user_by_id(%s)", (user_id,))
+                    
+                    row = cursor.fetchone()
+                    if not row:
+                        return None
+                    
+                    return self._row_to_user_account_tuple(row), row[2]
         except Exception as e:
             logger.error(f"Error getting user by ID from PostgreSQL: {e}")
             return None
     
-    def _get_user_by_id_dynamodb(self, user_id: str) -> Optional[UserAccount]:
-        """Get user by ID from DynamoDB"""
+    def _get_user_by_id_dynamodb(self, user_id: str) -> Optional[Tuple[UserAccount, Optional[str]]]:
+        """Get user and password hash by ID from DynamoDB"""
         try:
-            response = self.users_table.get_item(Key={'user_id': user_id})
+            response = self._ddb_client.get_item(
+                TableName=self.users_table_name,
+                Key={'user_id': self._ddb_serializer.serialize(user_id)}
+            )
             
             if 'Item' not in response:
                 return None
             
-            return self._item_to_user_account(response['Item'])
+            item = self._deserialize_item(response['Item'])
+            return self._item_to_user_account(item), item.get('password_hash')
         except Exception as e:
             logger.error(f"Error getting user by ID from DynamoDB: {e}")
             return None
     
     async def check_usage_limits(self, user_id: str, usage_type: str = 'message') -> bool:
         """Check if user can perform action based on usage limits"""
+        return await asyncio.to_thread(self._check_usage_limits_sync, user_id, usage_type)
+    
+    def _check_usage_limits_sync(self, user_id: str, usage_type: str = 'message') -> bool:
+        """Blocking implementation of check_usage_limits"""
         user = self._get_user_by_id(user_id)
         if not user:
             return False
         
+        # Only message usage is limited, and unlimited plans never need the usage lookup
+        limits = user.usage_limits
+        if usage_type != 'message' or (limits.daily_messages <= 0 and limits.monthly_messages <= 0):
+            return True
+        
         # Load current usage
-        current_usage = await self._get_current_usage(user_id)
+        current_usage = self._get_current_usage_sync(user_id)
         user.current_usage = current_usage
         
         if usage_type == 'message':
@@ -898,106 +1286,150 @@ class AWSUserManagementService:
     
     async def increment_usage(self, user_id: str, usage_type: str = 'message', count: int = 1):
         """Increment usage counter for a user"""
+        await asyncio.to_thread(self._increment_usage_sync, user_id, usage_type, count)
+    
+    def _increment_usage_sync(self, user_id: str, usage_type: str = 'message', count: int = 1):
+        """Blocking implementation of increment_usage"""
         if self.storage_type == "postgresql":
             with self._get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO user_usage (user_id, usage_type, usage_count)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (user_id, usage_type, usage_date)
-                    DO UPDATE SET usage_count = user_usage.usage_count + %s
-                """, (user_id, usage_type, count, count))
-                conn.commit()
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        INSERT INTO user_usage (user_id, usage_type, usage_count)
+                        VALUES (%s, %s, %s)
+                        ON CONFLICT (user_id, usage_type, usage_date)
+                        DO UPDATE SET usage_count = user_usage.usage_count + %s
+                    """, (user_id, usage_type, count, count))
+                    conn.commit()
         elif self.storage_type == "dynamodb":
-            today = datetime.now(timezone.utc).date().isoformat()
-            usage_date_type = f"{today}#{usage_type}"
+            today = _utc_today_iso()
+            usage_date_type = f"{usage_type}#{today}"
             
-            try:
-                self.usage_table.update_item(
-                    Key={
-                        'user_id': user_id,
-                        'usage_date_type': usage_date_type
-                    },
-                    UpdateExpression='ADD usage_count :count',
-                    ExpressionAttributeValues={':count': count}
-                )
-            except ClientError as e:
-                if e.response['Error']['Code'] == 'ValidationException':
-                    # Item doesn't exist, create it
-                    self.usage_table.put_item(
-                        Item={
-                            'user_id': user_id,
-                            'usage_date_type': usage_date_type,
-                            'usage_type': usage_type,
-                            'usage_date': today,
-                            'usage_count': count,
-                            'created_at': datetime.now(timezone.utc).isoformat()
-                        }
-                    )
-                else:
-                    raise
+            # ADD creates the item on first write; if_not_exists keeps the original descriptors
+            self.usage_table.update_item(
+                Key={
+                    'user_id': user_id,
+                    'usage_date_type': usage_date_type
+                },
+                UpdateExpression=(
+                    'ADD usage_count :count '
+                    'SET usage_type = if_not_exists(usage_type, :usage_type), '
+                    'usage_date = if_not_exists(usage_date, :usage_date), '
+                    'created_at = if_not_exists(created_at, :created_at)'
+                ),
+                ExpressionAttributeValues={
+                    ':count': count,
+                    ':usage_type': usage_type,
+                    ':usage_date': today,
+                    ':created_at': _utc_now_iso()
+                }
+            )
+        
+        if usage_type == 'message':
+            self._bump_cached_usage(user_id, count)
     
     async def _get_current_usage(self, user_id: str) -> Dict[str, int]:
         """Get current usage statistics for a user"""
+        return await asyncio.to_thread(self._get_current_usage_sync, user_id)
+    
+    def _get_current_usage_sync(self, user_id: str) -> Dict[str, int]:
+        """Blocking implementation of _get_current_usage, served from Redis when seeded"""
+        (daily_key, daily_ttl), (monthly_key, monthly_ttl) = self._usage_cache_keys(user_id)
+        client = shared_redis.client
+        if client is not None:
+            try:
+                daily, monthly = client.mget([daily_key, monthly_key])
+                if daily is not None and monthly is not None:
+                    return {'monthly_messages': int(monthly), 'daily_messages': int(daily)}
+            except redis.RedisError as e:
+                shared_redis.mark_unavailable(e)
+                client = None
+        
+        usage = self._load_current_usage(user_id)
+        if usage is None:
+            # Never seed the counters from a failed read
+            return {'monthly_messages': 0, 'daily_messages': 0}
+        
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                pipe.set(daily_key, int(usage['daily_messages']), ex=daily_ttl, nx=True)
+                pipe.set(monthly_key, int(usage['monthly_messages']), ex=monthly_ttl, nx=True)
+                pipe.execute()
+            except redis.RedisError as e:
+                shared_redis.mark_unavailable(e)
+        
+        return usage
+    
+    @staticmethod
+    def _usage_cache_keys(user_id: str) -> List[Tuple[str, int]]:
+        """Today's and this month's counter keys with their TTLs (capped at the period rollover)"""
+        now = datetime.now(timezone.utc)
+        next_day = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        next_month = (now.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        return [
+            (f"usage:{user_id}:day:{now:%Y%m%d}", max(1, min(_USAGE_CACHE_MAX_TTL, int((next_day - now).total_seconds())))),
+            (f"usage:{user_id}:mo:{now:%Y%m}", max(1, min(_USAGE_CACHE_MAX_TTL, int((next_month - now).total_seconds()))))
+        ]
+    
+    def _bump_cached_usage(self, user_id: str, count: int):
+        """Write-through to the Redis counters after the DB increment"""
+        client = shared_redis.client
+        if client is None:
+            return
+        
+        keys = [key for key, _ in self._usage_cache_keys(user_id)]
+        try:
+            client.eval(_INCR_EXISTING_USAGE_SCRIPT, len(keys), *keys, count)
+        except redis.RedisError as e:
+            shared_redis.mark_unavailable(e)
+    
+    def _load_current_usage(self, user_id: str) -> Optional[Dict[str, int]]:
+        """Aggregate today's and this month's message usage from the database (None on failure)"""
         if self.storage_type == "postgresql":
             with self._get_db_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Get monthly usage
-                cursor.execute("""
-                    SELECT SUM(usage_count) 
-                    FROM user_usage 
-                    WHERE user_id = %s 
-                    AND usage_type = 'message' 
-                    AND usage_date >= date_trunc('month', CURRENT_DATE)
-                """, (user_id,))
-                monthly_messages = cursor.fetchone()[0] or 0
-                
-                # Get daily usage
-                cursor.execute("""
-                    SELECT SUM(usage_count) 
-                    FROM user_usage 
-                    WHERE user_id = %s 
-                    AND usage_type = 'message' 
-                    AND usage_date = CURRENT_DATE
-                """, (user_id,))
-                daily_messages = cursor.fetchone()[0] or 0
-                
-                return {
-                    'monthly_messages': monthly_messages,
-                    'daily_messages': daily_messages
-                }
+                with conn.cursor() as cursor:
+                    # Monthly and daily totals in one pass over the month's rows
+                    cursor.execute("EXECUTE usage_agg(%s)", (user_id,))
+                    monthly_messages, daily_messages = cursor.fetchone()
+                    
+                    return {
+                        'monthly_messages': monthly_messages,
+                        'daily_messages': daily_messages
+                    }
         elif self.storage_type == "dynamodb":
             try:
-                current_date = datetime.now(timezone.utc).date()
-                month_start = current_date.replace(day=1).isoformat()
-                today = current_date.isoformat()
+                today = _utc_today_iso()
                 
-                # Get usage for this month
+                # Sort keys are "{type}#{date}", so "message#YYYY-MM" selects exactly this month's
+                # message rows; today's subtotal comes out of the same items
                 monthly_response = self.usage_table.query(
-                    KeyConditionExpression='user_id = :user_id AND begins_with(usage_date_type, :month)',
+                    KeyConditionExpression='user_id = :user_id AND begins_with(usage_date_type, :prefix)',
+                    ProjectionExpression='usage_count, usage_date',
                     ExpressionAttributeValues={
                         ':user_id': user_id,
-                        ':month': month_start
+                        ':prefix': f"message#{today[:7]}"
                     }
                 )
                 
-                monthly_messages = sum(item.get('usage_count', 0) 
-                                     for item in monthly_response['Items'] 
-                                     if item.get('usage_type') == 'message')
-                
-                # Get usage for today
-                daily_response = self.usage_table.query(
-                    KeyConditionExpression='user_id = :user_id AND begins_with(usage_date_type, :today)',
+                # Rows written before the key change are "{date}#{type}"; keep reading them
+                # until they age out of the current month (safe to drop one month after deploy)
+                legacy_response = self.usage_table.query(
+                    KeyConditionExpression='user_id = :user_id AND begins_with(usage_date_type, :month)',
+                    ProjectionExpression='usage_count, usage_date, usage_type',
                     ExpressionAttributeValues={
                         ':user_id': user_id,
-                        ':today': today
+                        ':month': today[:7]
                     }
                 )
+                legacy_items = [item for item in legacy_response['Items'] if item.get('usage_type') == 'message']
                 
-                daily_messages = sum(item.get('usage_count', 0) 
-                                   for item in daily_response['Items'] 
-                                   if item.get('usage_type') == 'message')
+                monthly_messages = 0
+                daily_messages = 0
+                for item in chain(monthly_response['Items'], legacy_items):
+                    count = int(item.get('usage_count', 0))
+                    monthly_messages += count
+                    if item.get('usage_date') == today:
+                        daily_messages += count
                 
                 return {
                     'monthly_messages': monthly_messages,
@@ -1005,72 +1437,160 @@ class AWSUserManagementService:
                 }
             except Exception as e:
                 logger.error(f"Error getting current usage from DynamoDB: {e}")
-                return {'monthly_messages': 0, 'daily_messages': 0}
+        
+        return None
     
     async def can_access_model(self, user_id: str, model_name: str) -> bool:
         """Check if user can access a specific model"""
-        user = self._get_user_by_id(user_id)
+        user = await asyncio.to_thread(self._get_user_by_id, user_id)
         if not user:
             return False
         
         return model_name in user.usage_limits.model_access
     
-    async def get_all_users(self, page: int = 1, limit: int = 50) -> Dict[str, Any]:
+    async def get_all_users(self, page: int = 1, limit: int = 50, cursor: Optional[str] = None) -> Dict[str, Any]:
         """Get paginated list of all users (admin only)"""
         if self.storage_type == "postgresql":
-            return await self._get_all_users_postgresql(page, limit)
+            return await asyncio.to_thread(self._get_all_users_postgresql, page, limit, cursor)
         elif self.storage_type == "dynamodb":
-            return await self._get_all_users_dynamodb(page, limit)
+            return await asyncio.to_thread(self._get_all_users_dynamodb, page, limit, cursor)
     
-    async def _get_all_users_postgresql(self, page: int, limit: int) -> Dict[str, Any]:
-        """Get all users from PostgreSQL"""
-        offset = (page - 1) * limit
-        
+    @staticmethod
+    def _encode_cursor(key: Dict[str, Any]) -> str:
+        """Encode a pagination key as an opaque API cursor"""
+        return base64.urlsafe_b64encode(json.dumps(key, default=str).encode('utf-8')).decode('ascii')
+    
+    @staticmethod
+    def _decode_cursor(cursor: str, keys: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+        """Decode an API cursor back into a pagination key (holding exactly the given string fields)"""
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (ValueError, UnicodeError):
+            raise ValueError("Invalid pagination cursor")
+        if not isinstance(key, dict):
+            raise ValueError("Invalid pagination cursor")
+        if keys is not None and (set(key) != set(keys) or not all(isinstance(v, str) for v in key.values())):
+            raise ValueError("Invalid pagination cursor")
+        return key
+    
+    def _get_all_users_postgresql(self, page: int, limit: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Get all users from PostgreSQL, keyset-paginated on (created_at, user_id)"""
         with self._get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Get total count
-            cursor.execute("SELECT COUNT(*) FROM users")
-            total_count = cursor.fetchone()[0]
+            with conn.cursor() as db_cursor:
+                
+                # Planner estimate is constant-time; an exact COUNT(*) scans the whole table
+                db_cursor.execute("SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE relname = 'users'")
+                row = db_cursor.fetchone()
+                total_count = row[0] if row else 0
+                
+            # Rows are rendered to JSON by PostgreSQL and streamed through a server-side cursor;
+            # one extra row tells us whether another page exists
+            with conn.cursor(name='admin_users_page') as page_cursor:
+                page_cursor.itersize = limit + 1
+                if cursor:
+                    after = self._decode_cursor(cursor, ('created_at', 'user_id'))
+                    try:
+                        datetime.fromisoformat(after['created_at'])
+                    except ValueError:
+                        raise ValueError("Invalid pagination cursor")
+                    page_cursor.execute("""
+                        SELECT row_to_json(u) FROM (
+                            SELECT user_id, email, role, usage_plan, status, is_email_verified, created_at, last_login
+                            FROM users 
+                            WHERE (created_at, user_id) < (%s, %s)
+                            ORDER BY created_at DESC, user_id DESC 
+                            LIMIT %s
+                        ) u
+                    """, (after['created_at'], after['user_id'], limit + 1))
+                else:
+                    page_cursor.execute("""
+                        SELECT row_to_json(u) FROM (
+                            SELECT user_id, email, role, usage_plan, status, is_email_verified, created_at, last_login
+                            FROM users 
+                            ORDER BY created_at DESC, user_id DESC 
+                            LIMIT %s OFFSET %s
+                        ) u
+                    """, (limit + 1, (page - 1) * limit))
+                
+                users = [row[0] for row in page_cursor]
             
-            # Get users
-            cursor.execute("""
-                SELECT user_id, email, role, usage_plan, status, is_email_verified, created_at, last_login
-                FROM users 
-                ORDER BY created_at DESC 
-                LIMIT %s OFFSET %s
-            """, (limit, offset))
+            has_next = len(users) > limit
+            users = users[:limit]
             
-            users = []
-            for row in cursor.fetchall():
-                users.append({
-                    'user_id': str(row[0]),
-                    'email': row[1],
-                    'role': row[2],
-                    'usage_plan': row[3],
-                    'status': row[4],
-                    'is_email_verified': row[5],
-                    'created_at': row[6].isoformat() if row[6] else None,
-                    'last_login': row[7].isoformat() if row[7] else None
-                })
+            next_cursor = None
+            if has_next:
+                last = users[-1]
+                next_cursor = self._encode_cursor({'created_at': last['created_at'], 'user_id': last['user_id']})
             
             return {
                 'users': users,
                 'total_count': total_count,
                 'page': page,
                 'limit': limit,
-                'total_pages': (total_count + limit - 1) // limit
+                'total_pages': (total_count + limit - 1) // limit,
+                'has_next': has_next,
+                'next_cursor': next_cursor
             }
     
-    async def _get_all_users_dynamodb(self, page: int, limit: int) -> Dict[str, Any]:
-        """Get all users from DynamoDB"""
+    def _get_all_users_dynamodb(self, page: int, limit: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Get all users from DynamoDB, newest first, via the UsersByCreatedAt index"""
         try:
-            # DynamoDB scan (not ideal for large datasets, but works for moderate user counts)
-            response = self.users_table.scan()
+            try:
+                return self._get_all_users_dynamodb_index(page, limit, cursor)
+            except ClientError as e:
+                error = e.response['Error']
+                # Index not created yet or still backfilling
+                if error['Code'] == 'ResourceNotFoundException' or (
+                    error['Code'] == 'ValidationException'
+                    and ('specified index' in error.get('Message', '') or 'backfilling' in error.get('Message', ''))
+                ):
+                    logger.warning(f"{_USERS_BY_CREATED_AT_INDEX} unavailable, listing users by parallel scan: {e}")
+                    return self._get_all_users_dynamodb_scan(page, limit)
+                # Anything else DynamoDB rejects here is a start key it did not issue
+                if cursor and error['Code'] == 'ValidationException':
+                    raise ValueError("Invalid pagination cursor")
+                raise
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error getting all users from DynamoDB: {e}")
+            return {
+                'users': [],
+                'total_count': 0,
+                'page': page,
+                'limit': limit,
+                'total_pages': 0,
+                'has_next': False,
+                'next_cursor': None
+            }
+    
+    def _get_all_users_dynamodb_index(self, page: int, limit: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Query one page of the UsersByCreatedAt index"""
+        query_kwargs = {
+            'IndexName': _USERS_BY_CREATED_AT_INDEX,
+            'KeyConditionExpression': Key('entity_type').eq(_USER_ENTITY_TYPE),
+            'ScanIndexForward': False
+        }
+        
+        if cursor:
+            start_key = self._decode_cursor(cursor, ('entity_type', 'created_at', 'user_id'))
+            if start_key['entity_type'] != _USER_ENTITY_TYPE:
+                raise ValueError("Invalid pagination cursor")
+            exhausted = False
+        else:
+            # Page-number callers: walk forward over keys only to find the page start
+            start_key, exhausted = self._skip_users_dynamodb(query_kwargs, (page - 1) * limit)
+        
+        users = []
+        next_key = None
+        if not exhausted:
+            if start_key:
+                query_kwargs['ExclusiveStartKey'] = start_key
+            response = self.users_table.query(Limit=limit, **query_kwargs)
+            next_key = response.get('LastEvaluatedKey')
             
-            all_users = []
             for item in response['Items']:
-                all_users.append({
+                users.append({
                     'user_id': item['user_id'],
                     'email': item['email'],
                     'role': item['role'],
@@ -1080,32 +1600,88 @@ class AWSUserManagementService:
                     'created_at': item.get('created_at'),
                     'last_login': item.get('last_login')
                 })
-            
-            # Sort by created_at (newest first)
-            all_users.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-            
-            # Paginate
-            total_count = len(all_users)
-            start_idx = (page - 1) * limit
-            end_idx = start_idx + limit
-            paginated_users = all_users[start_idx:end_idx]
-            
-            return {
-                'users': paginated_users,
-                'total_count': total_count,
-                'page': page,
-                'limit': limit,
-                'total_pages': (total_count + limit - 1) // limit
-            }
-        except Exception as e:
-            logger.error(f"Error getting all users from DynamoDB: {e}")
-            return {
-                'users': [],
-                'total_count': 0,
-                'page': page,
-                'limit': limit,
-                'total_pages': 0
-            }
+        
+        counter = self.users_table.get_item(Key={'user_id': _USER_COUNT_KEY}).get('Item', {})
+        total_count = int(counter.get('user_count', 0))
+        
+        return {
+            'users': users,
+            'total_count': total_count,
+            'page': page,
+            'limit': limit,
+            'total_pages': (total_count + limit - 1) // limit,
+            'has_next': next_key is not None,
+            'next_cursor': self._encode_cursor(next_key) if next_key else None
+        }
+    
+    def _get_all_users_dynamodb_scan(self, page: int, limit: int) -> Dict[str, Any]:
+        """List users newest first with a parallel segmented scan and a top-K heap"""
+        with ThreadPoolExecutor(max_workers=_USER_SCAN_SEGMENTS, thread_name_prefix='users-scan') as executor:
+            segments = list(executor.map(self._scan_users_segment, range(_USER_SCAN_SEGMENTS)))
+        
+        items = list(chain.from_iterable(segments))
+        total_count = len(items)
+        
+        # Only the first page * limit newest users are needed, so skip the full sort
+        newest = heapq.nlargest(page * limit, items, key=lambda item: item.get('created_at') or '')
+        users = [{
+            'user_id': item['user_id'],
+            'email': item['email'],
+            'role': item['role'],
+            'usage_plan': item['usage_plan'],
+            'status': item['status'],
+            'is_email_verified': item.get('is_email_verified', False),
+            'created_at': item.get('created_at'),
+            'last_login': item.get('last_login')
+        } for item in newest[(page - 1) * limit:]]
+        
+        return {
+            'users': users,
+            'total_count': total_count,
+            'page': page,
+            'limit': limit,
+            'total_pages': (total_count + limit - 1) // limit,
+            'has_next': total_count > page * limit,
+            'next_cursor': None
+        }
+    
+    def _scan_users_segment(self, segment: int) -> List[Dict[str, Any]]:
+        """Read every user row in one scan segment (the low-level client is thread-safe)"""
+        paginator = self._ddb_client.get_paginator('scan')
+        pages = paginator.paginate(
+            TableName=self.users_table_name,
+            Segment=segment,
+            TotalSegments=_USER_SCAN_SEGMENTS,
+            ProjectionExpression='user_id, email, #role, usage_plan, #status, is_email_verified, created_at, last_login',
+            ExpressionAttributeNames={'#role': 'role', '#status': 'status'}
+        )
+        items = []
+        for response in pages:
+            for raw in response['Items']:
+                item = self._deserialize_item(raw)
+                # Skips the user-count metadata item
+                if 'email' in item:
+                    items.append(item)
+        return items
+    
+    def _skip_users_dynamodb(self, query_kwargs: Dict[str, Any], to_skip: int) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Return (start key, exhausted) after skipping `to_skip` users on the listing index"""
+        start_key = None
+        while to_skip > 0:
+            skip_kwargs = dict(query_kwargs, Limit=to_skip, ProjectionExpression='user_id, entity_type, created_at')
+            if start_key:
+                skip_kwargs['ExclusiveStartKey'] = start_key
+            response = self.users_table.query(**skip_kwargs)
+            to_skip -= response['Count']
+            start_key = response.get('LastEvaluatedKey')
+            if not start_key:
+                return None, True
+        return start_key, False
 
 # Global instance with auto-detection of storage backend
-aws_user_management_service = AWSUserManagementService()
\ No newline at end of file
+aws_user_management_service = AWSUserManagementService()
+
+
+if __name__ == "__main__":
+    # python -m app.services.aws_user_management_service
+    aws_user_management_service.bootstrap_user_listing()
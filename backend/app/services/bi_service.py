@@ -1,24 +1,84 @@
+import asyncio
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 import re
-from typing import Dict, Any, List, Optional
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
 from ..db.snowflake_simple import get_snowflake_connection
 from ..db.snowflake_connection import SnowflakeQueryBuilder
 from ..core.ai_provider import ai_manager
 from .confluence_service import confluence_service
 from .file_service import file_service
 from .chat_history_service import chat_history_service
-import json
 import logging
+import orjson
+from cachetools import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Compiled once; used on every AI response
+_SQL_BLOCK_RE = re.compile(r'```sql\s*\n(.*?)\n```', re.DOTALL | re.IGNORECASE)
+_JSON_ARRAY_RE = re.compile(r'\[[\s\S]*?\]')
+# Fallback when there's no code block: the first line that starts a SELECT/WITH statement
+_SELECT_OR_WITH_RE = re.compile(r'^[ \t]*(?:SELECT|WITH)\b.*$', re.IGNORECASE | re.MULTILINE)
+
+# Single-row results of these aggregates are answered locally instead of via an insight round-trip
+_SIMPLE_AGGREGATE_RE = re.compile(r'\s*SELECT\s+(?:COUNT|SUM|AVG|MIN|MAX)\s*\(', re.IGNORECASE)
+
+# Words that suggest visualization would be helpful, matched against the query's tokens
+_WORD_RE = re.compile(r'[a-z]+')
+_CHART_KEYWORDS = frozenset({
+    'trend', 'trends', 'trending', 'timeline',
+    'compare', 'compared', 'comparing', 'comparison', 'versus', 'vs', 'against',
+    'top', 'bottom', 'highest', 'lowest', 'best', 'worst',
+    'distribution', 'breakdown', 'split', 'by',
+    'chart', 'charts', 'graph', 'graphs', 'plot', 'visualize', 'show',
+    'performance', 'productivity', 'efficiency',
+    'weekly', 'monthly', 'daily', 'quarterly',
+    'growth', 'decline', 'increase', 'increasing', 'decrease', 'decreasing'
+})
+_CHART_PHRASES = ('over time',)
+# Column names that look like dates/periods, used as the x-axis for trend charts
+_DATE_COL_RE = re.compile(r'DATE|TIME|WEEK|MONTH|DAY', re.IGNORECASE)
+
+# Rendered schema context keyed by the sorted table list; table lists and per-table
+# schemas are already cached on the Snowflake connection, this skips the formatting too
+_schema_context_cache: TTLCache = TTLCache(maxsize=8, ttl=180)
+# Confluence credentials only come from settings, so the configured check is remembered for a while
+_confluence_configured_cache: TTLCache = TTLCache(maxsize=1, ttl=300)
+
+# Notes attached to schema columns for the AI: the first matching substring wins,
+# join columns are matched on the full (upper-cased) name
+_COL_NOTE_RULES = (
+    ('ADHERENCE_PERCENTAGE', "use TRY_TO_NUMBER() - may contain '-'"),
+    ('DATE', "date column"),
+    ('SUPERVISOR', "for filtering by supervisor"),
+)
+_JOIN_COLS = frozenset({'AGENT_NAME', 'ASSIGNEE_NAME'})
+
+
+def _split_dtype_columns(df: pd.DataFrame) -> Tuple[List[str], List[str]]:
+    """Numeric and object column names from a single pass over the dtypes"""
+    numeric_columns = []
+    categorical_columns = []
+    for col, dtype in zip(df.columns, df.dtypes.to_numpy()):
+        if dtype.kind in 'iufc':
+            numeric_columns.append(col)
+        elif dtype.kind == 'O':
+            categorical_columns.append(col)
+    return numeric_columns, categorical_columns
+
 
 class BIService:
     def __init__(self):
         self.snowflake_db = get_snowflake_connection()
         self.query_builder = SnowflakeQueryBuilder(self.snowflake_db)
         self.ai_manager = ai_manager
+        # Chat history writes are drained in order by a single background worker
+        self._history_queue: asyncio.Queue = asyncio.Queue(maxsize=1024)
+        self._history_worker: Optional[asyncio.Task] = None
     
     async def process_natural_language_query(self, user_query: str, context: Optional[Dict[str, Any]] = None, conversation_history: Optional[List[Dict[str, str]]] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
         """Process natural language query and return business insights"""
@@ -29,44 +89,38 @@ class BIService:
             current_session_id = user_session["session_id"]
             
             # Save user message to chat history
-            try:
-                chat_history_service.save_message(
-                    user_id=user_id,
-                    session_id=current_session_id,
-                    role="user",
-                    content=user_query
-                )
-            except Exception as e:
-                logger.warning(f"Failed to save user message to history: {str(e)}")
+            await self._queue_history_write(
+                user_id=user_id,
+                session_id=current_session_id,
+                role="user",
+                content=user_query
+            )
             
-            # Build enhanced user message with context
-            enhanced_query = user_query
+            # Schema, Confluence and file context are independent, so fetch them together
+            file_ids = context["file_ids"] if context and "file_ids" in context else []
+            schema_info, confluence_context, file_contexts = await asyncio.gather(
+                self._get_schema_context_for_query(),
+                self._get_confluence_context(user_query),
+                self._get_file_contexts(file_ids)
+            )
             
-            # Add dynamic schema information
-            tables = self.snowflake_db.get_available_tables()
-            schema_info = self._get_dynamic_schema_context(tables)
-            enhanced_query += f"\n\nDATABASE SCHEMA INFORMATION:\n{schema_info}"
+            # Build enhanced user message with context (sections are joined once at the end),
+            # starting with the dynamic schema information
+            parts = [user_query, f"DATABASE SCHEMA INFORMATION:\n{schema_info}"]
             
             # Add Confluence context if configured
-            if await confluence_service.is_configured():
-                confluence_context = await confluence_service.get_context_for_query(user_query)
-                if confluence_context:
-                    enhanced_query += f"\n\nBusiness context from Confluence:\n{confluence_context}"
+            if confluence_context:
+                parts.append(f"Business context from Confluence:\n{confluence_context}")
             
             # Add file context if provided
-            if context and "file_ids" in context:
-                file_contexts = []
-                for file_id in context["file_ids"]:
-                    file_content = await file_service.get_file_content_for_context(file_id)
-                    if file_content:
-                        file_contexts.append(file_content)
-                
-                if file_contexts:
-                    enhanced_query += f"\n\nAdditional file context:\n" + "\n---\n".join(file_contexts)
+            if file_contexts:
+                parts.append("Additional file context:\n" + "\n---\n".join(file_contexts))
             
             # Add additional context if provided
             if context:
-                enhanced_query += f"\n\nAdditional context: {json.dumps(context, indent=2)}"
+                parts.append(f"Additional context: {orjson.dumps(context, option=orjson.OPT_INDENT_2).decode()}")
+            
+            enhanced_query = "\n\n".join(parts)
             
             # Use Assistant API with vector store for better context and larger token limit
             logger.info("Using Assistant API with vector store")
@@ -87,10 +141,12 @@ class BIService:
             if result.get("sql_query"):
                 logger.info(f"Executing SQL query: {result['sql_query']}")
                 query_result = await self._execute_and_analyze_query(result["sql_query"])
+                insights_task = query_result.pop("insights_task", None)
                 logger.info(f"Query result: {query_result}")
                 result.update(query_result)
                 
-                # Generate charts if appropriate
+                # Generate charts if appropriate, overlapping the insights round-trip
+                charts_task = None
                 if result.get("data") and len(result["data"]) > 0:
                     try:
                         # Convert data to DataFrame for chart generation
@@ -99,38 +155,57 @@ class BIService:
                         # Check if charts would be beneficial
                         if self.should_generate_charts(user_query, df):
                             logger.info("Generating charts for visualization")
-                            charts = self.generate_charts_from_data(df, user_query, result.get("insights", []))
-                            if charts:
-                                result["charts"] = charts
-                                logger.info(f"Generated {len(charts)} charts")
+                            charts_task = asyncio.to_thread(self.generate_charts_from_data, df, user_query, [])
                     except Exception as e:
                         logger.warning(f"Error generating charts: {str(e)}")
+                
+                if insights_task is not None or charts_task is not None:
+                    insights, charts = await asyncio.gather(
+                        insights_task if insights_task is not None else self._no_results(),
+                        charts_task if charts_task is not None else self._no_results(),
+                        return_exceptions=True
+                    )
+                    
+                    if isinstance(insights, Exception):
+                        logger.error(f"Error generating insights: {str(insights)}")
+                        insights = []
+                    if insights_task is not None:
+                        logger.info(f"Generated {len(insights)} insights")
+                        result["insights"] = insights
+                    
+                    if isinstance(charts, Exception):
+                        logger.warning(f"Error generating charts: {str(charts)}")
+                    elif charts:
+                        result["charts"] = charts
+                        logger.info(f"Generated {len(charts)} charts")
             else:
                 logger.warning("No SQL query found in response")
             
             logger.info(f"Final result: {result}")
             
             # Save assistant response to chat history
-            try:
-                assistant_message_id = chat_history_service.save_message(
-                    user_id=user_id,
-                    session_id=current_session_id,
-                    role="assistant",
-                    content=ai_response.content,
-                    query_results=result.get("data"),
-                    insights=result.get("insights"),
-                    sql_query=result.get("sql_query")
-                )
-                
-                # Add session info to result for frontend
-                result["session_info"] = {
-                    "user_id": user_id,
-                    "session_id": current_session_id,
-                    "message_id": assistant_message_id
-                }
-                
-            except Exception as e:
-                logger.warning(f"Failed to save assistant response to history: {str(e)}")
+            assistant_message_id = str(uuid.uuid4())
+            # Awaited so the id handed to the client (e.g. for feedback) already exists
+            saved = await self._queue_history_write(
+                wait=True,
+                user_id=user_id,
+                session_id=current_session_id,
+                role="assistant",
+                content=ai_response.content,
+                query_results=result.get("data"),
+                insights=result.get("insights"),
+                sql_query=result.get("sql_query"),
+                message_id=assistant_message_id
+            )
+            if not saved:
+                assistant_message_id = None
+            
+            # Add session info to result for frontend
+            result["session_info"] = {
+                "user_id": user_id,
+                "session_id": current_session_id,
+                "message_id": assistant_message_id
+            }
             
             return result
             
@@ -140,7 +215,7 @@ class BIService:
             # Try to save error to chat history if we have session info
             try:
                 if 'user_id' in locals() and 'current_session_id' in locals():
-                    chat_history_service.save_message(
+                    await self._queue_history_write(
                         user_id=user_id,
                         session_id=current_session_id,
                         role="assistant",
@@ -154,148 +229,100 @@ class BIService:
                 "success": False
             }
     
-    def _build_system_prompt(self, tables: List[str]) -> str:
-        """Build system prompt with database schema information"""
+    async def _queue_history_write(self, wait: bool = False, **message: Any) -> bool:
+        """Hand a chat-history write to the background worker (waits only if the queue is full).
         
-        # Get schema information for key tables
-        schema_info = {}
-        for table in tables[:3]:  # Limit to first 3 tables to avoid token limit
+        With wait=True, also waits until this message (and everything queued before it)
+        has been persisted and returns whether it was saved.
+        """
+        if self._history_worker is None or self._history_worker.done():
+            self._history_worker = asyncio.create_task(self._drain_history_writes())
+        saved = asyncio.get_running_loop().create_future() if wait else None
+        await self._history_queue.put((message, saved))
+        if saved is None:
+            return True
+        return await saved
+    
+    async def _drain_history_writes(self):
+        """Persist queued chat-history messages one at a time, preserving their order"""
+        while True:
+            message, saved = await self._history_queue.get()
+            ok = False
             try:
-                schema = self.snowflake_db.get_table_schema(table)
-                # Only keep essential schema info
-                schema_info[table] = {k: v.get('type', 'VARCHAR') for k, v in schema.items()}
+                await asyncio.to_thread(chat_history_service.save_message, **message)
+                ok = True
             except Exception as e:
-                logger.warning(f"Could not get schema for table {table}: {str(e)}")
-        
-        # Get sample data only for key tables with latest data first
-        sample_data = {}
-        key_tables = ['RPT_AGENT_SCHEDULE_ADHERENCE', 'RPT_WOPS_AGENT_PERFORMANCE']
-        for table in key_tables:
-            if table in tables:
-                try:
-                    # Get sample data ordered by audit/timestamp columns for latest data
-                    sample_df = self.snowflake_db.get_table_sample_ordered(table, 3)
-                    if not sample_df.empty:
-                        # Include more relevant columns for better context
-                        if table == 'RPT_AGENT_SCHEDULE_ADHERENCE':
-                            key_cols = ['AGENT_NAME', 'ADHERENCE_PERCENTAGE', 'ADHERENCE_DATE', 'SCHEDULED_MINUTES', 'ADHERENT_MINUTES']
-                        elif table == 'RPT_WOPS_AGENT_PERFORMANCE':
-                            key_cols = ['ASSIGNEE_NAME', 'ASSIGNEE_SUPERVISOR', 'SOLVED_WEEK', 'NUM_TICKETS', 'AHT_MINUTES']
-                        else:
-                            key_cols = list(sample_df.columns)[:6]  # First 6 columns for other tables
-                            
-                        available_cols = [col for col in key_cols if col in sample_df.columns]
-                        if not available_cols:  # If none of the key columns exist, use first few columns
-                            available_cols = list(sample_df.columns)[:5]
-                        
-                        if available_cols:
-                            sample_data[table] = sample_df[available_cols].to_dict('records')
-                except Exception as e:
-                    logger.warning(f"Could not get sample for table {table}: {str(e)}")
-                    # Fallback to regular sample if ordered sample fails
-                    try:
-                        sample_df = self.snowflake_db.get_table_sample_ordered(table, 2)
-                        if not sample_df.empty:
-                            available_cols = list(sample_df.columns)[:5]
-                            sample_data[table] = sample_df[available_cols].to_dict('records')
-                    except Exception as e2:
-                        logger.warning(f"Fallback sample also failed for table {table}: {str(e2)}")
+                logger.warning(f"Failed to save {message.get('role')} message to history: {str(e)}")
+            finally:
+                if saved is not None and not saved.done():
+                    saved.set_result(ok)
+                self._history_queue.task_done()
+    
+    async def flush_history_writes(self, timeout: float = 10.0):
+        """Persist everything still queued and stop the worker (called on shutdown)"""
+        if self._history_worker is None or self._history_worker.done():
+            return
+        try:
+            await asyncio.wait_for(self._history_queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropped {self._history_queue.qsize()} unsaved chat-history messages on shutdown")
+        self._history_worker.cancel()
+    
+    async def _get_schema_context_for_query(self) -> str:
+        """Table list (off the event loop) rendered into the schema context"""
+        loop = asyncio.get_running_loop()
+        tables = await loop.run_in_executor(None, self.snowflake_db.get_available_tables)
+        return await self._get_dynamic_schema_context(tables)
+    
+    async def _get_confluence_context(self, user_query: str) -> str:
+        """Confluence context for the query, or an empty string when not configured"""
+        if not await self._confluence_configured():
+            return ""
+        return await confluence_service.get_context_for_query(user_query)
+    
+    async def _confluence_configured(self) -> bool:
+        configured = _confluence_configured_cache.get("configured")
+        if configured is None:
+            configured = await confluence_service.is_configured()
+            _confluence_configured_cache["configured"] = configured
+        return configured
+    
+    async def _get_file_contexts(self, file_ids: List[str]) -> List[str]:
+        """Extracted text of the attached files that have any"""
+        # Fetch attachments together, but cap how many hit file storage at once
+        semaphore = asyncio.Semaphore(8)
         
-        prompt = f"""
-You are a business intelligence assistant for Clipboard Health's Worker Operations team. 
-Your role is to help analyze data and provide insights from the Snowflake database.
-
-Available tables: {', '.join(tables)}
-
-Schema (column names and types):
-{json.dumps(schema_info, indent=1)}
-
-Sample data examples:
-{json.dumps(sample_data, indent=1, default=str)}
-
-CRITICAL: When a user asks a question about data, you MUST:
-1. Generate a SELECT query that will be EXECUTED against the database
-2. The query will be run and the actual results returned to the user
-3. Always provide specific data answers, not just query explanations
-4. Only use SELECT statements - no INSERT, UPDATE, DELETE, etc.
-5. All queries are automatically limited to 200 rows
-6. IMPORTANT: Only use column names that EXACTLY match those in the schema above
-7. IMPORTANT: Look at the sample data to understand the actual data format and values
-8. If a user asks about a column that doesn't exist, suggest alternatives or explain what's available
-
-For questions about data, generate SQL queries that will retrieve the actual data to answer the question.
-
-KEY TABLES AND COLUMNS:
-- RPT_AGENT_SCHEDULE_ADHERENCE: AGENT_NAME, ADHERENCE_PERCENTAGE, SCHEDULED_MINUTES, ADHERENT_MINUTES, ADHERENCE_DATE
-- RPT_WOPS_AGENT_PERFORMANCE: ASSIGNEE_NAME, ASSIGNEE_SUPERVISOR, NUM_TICKETS, AHT_MINUTES, FCR_PERCENTAGE, QA_SCORE
-
-IMPORTANT: For joining tables to find agents under supervisors:
-- Use ASSIGNEE_NAME from RPT_WOPS_AGENT_PERFORMANCE to match with AGENT_NAME from RPT_AGENT_SCHEDULE_ADHERENCE
-- Use ASSIGNEE_SUPERVISOR from RPT_WOPS_AGENT_PERFORMANCE to filter by supervisor
-
-IMPORTANT: For numeric comparisons with ADHERENCE_PERCENTAGE, use TRY_TO_NUMBER() because some values may contain '-' or other non-numeric characters:
-- Correct: WHERE TRY_TO_NUMBER(ADHERENCE_PERCENTAGE) >= 90
-- Incorrect: WHERE ADHERENCE_PERCENTAGE >= 90
-
-The schema information below shows the exact column names and types for each table.
-
-Response format (JSON):
-{{
-    "sql_query": "SELECT column_name FROM table_name WHERE condition ORDER BY column_name",
-    "explanation": "Clear explanation of what the query does and what results it will return",
-    "business_context": "Business context explaining why this analysis is valuable",
-    "expected_insights": ["List of key insights the query will provide"]
-}}
-
-IMPORTANT: Always provide complete, valid SQL queries that can be executed. Include proper FROM clauses and ensure all column names exist in the schema.
-
-Guidelines:
-- Only use SELECT statements (no INSERT, UPDATE, DELETE, DROP)
-- Use proper Snowflake SQL syntax
-- Include appropriate WHERE clauses and filters
-- Use aggregation functions for summary statistics
-- Consider time-based analysis for trends
-- Focus on Worker Operations metrics like productivity, scheduling, performance
-
-DATE/TIME QUERIES - IMPORTANT:
-- For "this week" queries, use simple date comparisons: WHERE date_column >= '2025-07-14' AND date_column < '2025-07-21'
-- For "today" queries, use: WHERE date_column = CURRENT_DATE()
-- Avoid complex timezone conversions and DATE_TRUNC with timezones
-- Keep date filtering simple and straightforward
-- If you need current date, use CURRENT_DATE() or GETDATE()
-
-EXAMPLE DATE QUERIES:
-- This week: WHERE CREATED_DATE >= '2025-07-14' AND CREATED_DATE < '2025-07-21'
-- Last 7 days: WHERE CREATED_DATE >= DATEADD(day, -7, CURRENT_DATE())
-- This month: WHERE MONTH(CREATED_DATE) = MONTH(CURRENT_DATE()) AND YEAR(CREATED_DATE) = YEAR(CURRENT_DATE())
-"""
+        async def fetch(file_id: str) -> Optional[str]:
+            async with semaphore:
+                return await file_service.get_file_content_for_context(file_id)
         
-        return prompt
+        file_contents = await asyncio.gather(*(fetch(file_id) for file_id in file_ids))
+        return [file_content for file_content in file_contents if file_content]
     
     def _parse_ai_response(self, response: str) -> Dict[str, Any]:
         """Parse AI response to extract structured information"""
         try:
-            # Try to parse as JSON first
-            if response.strip().startswith('{'):
-                return json.loads(response)
+            # Try to parse as JSON first; malformed JSON falls through to the text extraction
+            stripped = response.lstrip()
+            if stripped.startswith('{'):
+                try:
+                    return orjson.loads(stripped)
+                except orjson.JSONDecodeError:
+                    pass
             
             # For assistant responses, extract SQL from code blocks or lines
             sql_query = None
             explanation = []
             
             # Look for SQL in code blocks first
-            import re
-            sql_blocks = re.findall(r'```sql\s*\n(.*?)\n```', response, re.DOTALL | re.IGNORECASE)
-            if sql_blocks:
-                sql_query = sql_blocks[0].strip()
+            sql_block = _SQL_BLOCK_RE.search(response)
+            if sql_block:
+                sql_query = sql_block.group(1).strip()
             else:
                 # Look for SQL queries in the text
-                lines = response.split('\n')
-                for line in lines:
-                    line = line.strip()
-                    if line.upper().startswith('SELECT') or line.upper().startswith('WITH'):
-                        sql_query = line
-                        break
+                sql_line = _SELECT_OR_WITH_RE.search(response)
+                if sql_line:
+                    sql_query = sql_line.group(0).strip()
             
             # Use the entire response as explanation
             explanation = response.strip()
@@ -330,26 +357,26 @@ EXAMPLE DATE QUERIES:
                     "success": False
                 }
             
-            # Execute query
-            df = self.snowflake_db.execute_query(sql_query)
+            # Execute query, keeping the results in Arrow form
+            table = self.snowflake_db.execute_query_arrow(sql_query)
+            row_count = table.num_rows
+            columns = table.column_names
             
-            # Clean data for JSON serialization
-            df_cleaned = self._clean_dataframe_for_json(df)
+            # JSON rows come straight from Arrow; pandas is only needed for the insight summary
+            data = self._arrow_to_records(table)
+            df = table.to_pandas(split_blocks=True, self_destruct=True)
+            del table
             
-            # Generate insights from results
-            logger.info(f"Generating insights for {len(df_cleaned)} rows")
-            try:
-                insights = await self._generate_insights_from_data(df_cleaned, sql_query)
-                logger.info(f"Generated {len(insights)} insights")
-            except Exception as e:
-                logger.error(f"Error generating insights: {str(e)}")
-                insights = []
+            # Start insights in the background; the caller awaits them alongside charts
+            logger.info(f"Generating insights for {row_count} rows")
+            insights_task = asyncio.create_task(self._generate_insights_from_data(df, sql_query))
             
             return {
-                "data": df_cleaned.to_dict('records'),
-                "row_count": len(df_cleaned),
-                "columns": df_cleaned.columns.tolist(),
-                "insights": insights,
+                "data": data,
+                "row_count": row_count,
+                "columns": columns,
+                "insights": [],
+                "insights_task": insights_task,
                 "success": True
             }
             
@@ -360,49 +387,60 @@ EXAMPLE DATE QUERIES:
                 "success": False
             }
     
-    def _clean_dataframe_for_json(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Clean DataFrame to ensure JSON serialization compatibility"""
-        import numpy as np
-        
-        # Create a copy to avoid modifying original
-        df_cleaned = df.copy()
-        
-        # Replace NaN, infinity, and other non-JSON-compliant values
-        df_cleaned = df_cleaned.replace([np.inf, -np.inf], np.nan)
-        
-        # Convert all columns to JSON-safe types
-        for col in df_cleaned.columns:
-            if df_cleaned[col].dtype == 'object':
-                # Convert to string and replace nan with None
-                df_cleaned[col] = df_cleaned[col].astype(str).replace('nan', None)
-            elif np.issubdtype(df_cleaned[col].dtype, np.integer):
-                # Convert to regular int, handling NaN
-                df_cleaned[col] = df_cleaned[col].astype('Int64')
-            elif np.issubdtype(df_cleaned[col].dtype, np.floating):
-                # Convert to regular float, handling NaN
-                df_cleaned[col] = df_cleaned[col].astype('Float64')
+    @staticmethod
+    def _arrow_to_records(table: pa.Table) -> List[Dict[str, Any]]:
+        """Convert an Arrow table to JSON-safe records (NaN/inf become None, like the DataFrame cleaner)"""
+        for i, field in enumerate(table.schema):
+            if pa.types.is_floating(field.type):
+                column = table.column(i)
+                table = table.set_column(i, field, pc.if_else(pc.is_finite(column), column, pa.scalar(None, type=field.type)))
+        return table.to_pylist()
+    
+    @staticmethod
+    async def _no_results() -> List[Any]:
+        return []
+    
+    def _finalize_dataframe_for_json(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Make a freshly fetched DataFrame JSON-safe in place (the caller hands over ownership)"""
+        # Infinity is not valid JSON; treat it as missing
+        numeric_cols = df.select_dtypes(include=[np.number]).columns
+        if len(numeric_cols) > 0:
+            df[numeric_cols] = df[numeric_cols].replace([np.inf, -np.inf], np.nan)
         
-        # Final pass to replace any remaining NaN values
-        df_cleaned = df_cleaned.where(pd.notnull(df_cleaned), None)
+        # Only columns that actually hold NaN/None/NaT need object dtype so missing values become None;
+        # the rest keep their native dtype (and stay numeric for insights)
+        null_mask = df.isna()
+        null_cols = df.columns[null_mask.any().to_numpy()]
+        if len(null_cols) > 0:
+            df[null_cols] = df[null_cols].astype(object).where(~null_mask[null_cols], None)
         
-        return df_cleaned
+        return df
     
     async def _generate_insights_from_data(self, df: pd.DataFrame, sql_query: str) -> List[str]:
         """Generate business insights from query results"""
+        # Degenerate results don't need an AI round-trip
+        if len(df) == 0:
+            return ["No rows returned."]
+        if len(df) == 1 and (len(df.columns) <= 3 or _SIMPLE_AGGREGATE_RE.match(sql_query)):
+            row = df.iloc[0]
+            return [f"{col}: {row[col]}" for col in df.columns]
+        
         try:
             # Prepare data summary for AI
+            numeric_cols = df.select_dtypes(include=np.number).columns
+            # Sample only the leading (usually label) columns plus a few metrics to keep the prompt short
+            sample_cols = list(dict.fromkeys([*df.columns[:2], *numeric_cols[:6]]))
             data_summary = {
                 "row_count": len(df),
                 "columns": df.columns.tolist(),
-                "sample_data": df.head(5).to_dict('records') if len(df) > 0 else [],
-                "data_types": df.dtypes.to_dict(),
-                "null_counts": df.isnull().sum().to_dict()
+                "sample_data": df.iloc[:5][sample_cols].to_dict('records'),
+                "data_types": {col: str(dtype) for col, dtype in df.dtypes.items()},
+                "null_counts": df.isna().sum().to_dict()
             }
             
-            # Add basic statistics for numeric columns
-            numeric_cols = df.select_dtypes(include=['number']).columns
+            # Add basic statistics for numeric columns (percentiles aren't used, so skip describe())
             if len(numeric_cols) > 0:
-                data_summary["numeric_statistics"] = df[numeric_cols].describe().to_dict()
+                data_summary["numeric_statistics"] = df[numeric_cols].agg(['min', 'max', 'mean', 'std', 'count']).to_dict()
             
             # Build prompt for insight generation
             from datetime import datetime
@@ -416,7 +454,7 @@ CURRENT DATE: {current_date} (Today's date is {current_date}, current year is {c
 Based on the following query results, provide 3-5 TLDR-style bullet points as the direct answer:
 
 SQL Query: {sql_query}
-Data Summary: {json.dumps(data_summary, indent=2, default=str)}
+Data Summary: {orjson.dumps(data_summary, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS, default=str).decode()}
 
 CRITICAL REQUIREMENTS:
 - Each point is the direct answer to the user's question
@@ -444,23 +482,22 @@ Return ONLY a JSON array of direct answer points.
             # Parse insights from AI response
             try:
                 # First try direct JSON parsing
-                insights = json.loads(ai_response.content)
+                insights = orjson.loads(ai_response.content)
                 if isinstance(insights, list):
                     return insights
                 elif isinstance(insights, dict) and 'insights' in insights:
                     return insights['insights'] if isinstance(insights['insights'], list) else [str(insights['insights'])]
                 else:
                     return [str(insights)]
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 # Try to extract JSON array from the response text
-                import re
                 # Look for JSON array patterns
-                array_match = re.search(r'\[[\s\S]*?\]', ai_response.content)
+                array_match = _JSON_ARRAY_RE.search(ai_response.content)
                 if array_match:
                     try:
-                        insights = json.loads(array_match.group(0))
+                        insights = orjson.loads(array_match.group(0))
                         return insights if isinstance(insights, list) else [ai_response.content]
-                    except json.JSONDecodeError:
+                    except orjson.JSONDecodeError:
                         pass
                 
                 # If no JSON found, return the content as a single insight
@@ -499,10 +536,22 @@ Return ONLY a JSON array of direct answer points.
             logger.error(f"Error getting dashboard metrics: {str(e)}")
             return {"error": str(e)}
     
-    def _get_dynamic_schema_context(self, tables: List[str]) -> str:
+    def invalidate_schema_cache(self):
+        """Drop cached table lists, schemas and rendered schema context (e.g. after DDL)"""
+        _schema_context_cache.clear()
+        if hasattr(self.snowflake_db, '_invalidate_cache'):
+            self.snowflake_db._invalidate_cache()
+    
+    async def _get_dynamic_schema_context(self, tables: List[str]) -> str:
         """Generate dynamic schema context from database metadata"""
+        cache_key = tuple(sorted(tables))
+        cached = _schema_context_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             schema_info = []
+            complete = True
             
             # Focus on key tables for Worker Operations
             priority_tables = [
@@ -523,10 +572,17 @@ Return ONLY a JSON array of direct answer points.
                 if table not in ordered_tables and len(ordered_tables) < 5:
                     ordered_tables.append(table)
             
-            for table in ordered_tables:
+            # Fetch every table's schema concurrently instead of one round-trip after another
+            loop = asyncio.get_running_loop()
+            schemas = await asyncio.gather(
+                *(loop.run_in_executor(None, self.snowflake_db.get_table_schema, table) for table in ordered_tables),
+                return_exceptions=True
+            )
+            
+            for table, schema in zip(ordered_tables, schemas):
                 try:
-                    # Get table schema
-                    schema = self.snowflake_db.get_table_schema(table)
+                    if isinstance(schema, Exception):
+                        raise schema
                     
                     if schema:
                         # Build column info with types and special notes
@@ -535,19 +591,12 @@ Return ONLY a JSON array of direct answer points.
                             col_type = col_info.get('type', 'VARCHAR')
                             
                             # Add special notes for key columns
-                            notes = []
-                            if 'ADHERENCE_PERCENTAGE' in col_name.upper():
-                                notes.append("use TRY_TO_NUMBER() - may contain '-'")
-                            elif 'DATE' in col_name.upper():
-                                notes.append("date column")
-                            elif 'SUPERVISOR' in col_name.upper():
-                                notes.append("for filtering by supervisor")
-                            elif col_name.upper() in ['AGENT_NAME', 'ASSIGNEE_NAME']:
-                                notes.append("for joining tables")
+                            col_upper = col_name.upper()
+                            note = next((note for key, note in _COL_NOTE_RULES if key in col_upper), None)
+                            if note is None and col_upper in _JOIN_COLS:
+                                note = "for joining tables"
                             
-                            col_desc = f"{col_name} ({col_type})"
-                            if notes:
-                                col_desc += f" - {', '.join(notes)}"
+                            col_desc = f"{col_name} ({col_type}) - {note}" if note else f"{col_name} ({col_type})"
                             
                             columns_info.append(col_desc)
                         
@@ -559,6 +608,7 @@ Return ONLY a JSON array of direct answer points.
                     logger.warning(f"Could not get schema for table {table}: {str(e)}")
                     # Add basic info if schema fetch fails
                     schema_info.append(f"- {table}: Schema not available")
+                    complete = False
             
             # Add important join information
             join_info = """
@@ -581,7 +631,12 @@ IMPORTANT NOTES:
 - All date columns should be filtered appropriately for time-based analysis
 - Names in database may be full names while users provide nicknames/short names"""
             
-            return '\n'.join(schema_info) + join_info
+            schema_context = '\n'.join(schema_info) + join_info
+            
+            # Don't pin a partial context for the whole TTL
+            if complete:
+                _schema_context_cache[cache_key] = schema_context
+            return schema_context
             
         except Exception as e:
             logger.error(f"Error generating dynamic schema context: {str(e)}")
@@ -625,23 +680,14 @@ Join: AGENT_NAME = ASSIGNEE_NAME"""
         if data.empty or len(data) < 2:
             return False
             
-        # Keywords that suggest visualization would be helpful
-        chart_keywords = [
-            'trend', 'trends', 'trending', 'over time', 'timeline',
-            'compare', 'comparison', 'versus', 'vs', 'against',
-            'top', 'bottom', 'highest', 'lowest', 'best', 'worst',
-            'distribution', 'breakdown', 'split', 'by',
-            'chart', 'graph', 'plot', 'visualize', 'show',
-            'performance', 'productivity', 'efficiency',
-            'weekly', 'monthly', 'daily', 'quarterly',
-            'growth', 'decline', 'increase', 'decrease'
-        ]
-        
         query_lower = user_query.lower()
-        has_chart_keywords = any(keyword in query_lower for keyword in chart_keywords)
+        has_chart_keywords = (
+            not _CHART_KEYWORDS.isdisjoint(_WORD_RE.findall(query_lower))
+            or any(phrase in query_lower for phrase in _CHART_PHRASES)
+        )
         
         # Check if data has numeric columns suitable for charting
-        numeric_columns = data.select_dtypes(include=[np.number]).columns
+        numeric_columns, _ = _split_dtype_columns(data)
         has_numeric_data = len(numeric_columns) > 0
         
         # Check if data has categorical/time columns for grouping
@@ -657,14 +703,10 @@ Join: AGENT_NAME = ASSIGNEE_NAME"""
         charts = []
         
         try:
-            # Limit data size for performance
-            if len(data) > 50:
-                data_sample = data.head(50)
-            else:
-                data_sample = data.copy()
+            # Limit data size for performance (the chart helpers only read the frame, so no copy)
+            data_sample = data.head(50) if len(data) > 50 else data
             
-            numeric_columns = data_sample.select_dtypes(include=[np.number]).columns.tolist()
-            categorical_columns = data_sample.select_dtypes(include=['object']).columns.tolist()
+            numeric_columns, categorical_columns = _split_dtype_columns(data_sample)
             
             # Generate different chart types based on data structure
             charts.extend(self._generate_trend_charts(data_sample, numeric_columns, categorical_columns, query))
@@ -683,25 +725,33 @@ Join: AGENT_NAME = ASSIGNEE_NAME"""
         charts = []
         
         # Look for date/time columns
-        date_columns = [col for col in data.columns if any(date_word in col.upper() for date_word in ['DATE', 'TIME', 'WEEK', 'MONTH', 'DAY'])]
+        date_columns = [col for col in data.columns if _DATE_COL_RE.search(col)]
         
         if date_columns and numeric_cols:
             date_col = date_columns[0]
+            metrics = [col for col in numeric_cols[:2] if col != date_col]  # Limit to 2 metrics
             
-            for numeric_col in numeric_cols[:2]:  # Limit to 2 metrics
+            try:
+                # Sort by date and aggregate every metric in one groupby pass
+                trend_data = data.groupby(date_col)[metrics].mean()
+            except Exception as e:
+                logger.warning(f"Error generating trend charts for {metrics}: {str(e)}")
+                return charts
+            
+            # Every metric shares the grouped date index
+            labels = list(map(str, trend_data.index))
+            
+            for numeric_col in metrics:
                 try:
-                    # Sort by date and aggregate if needed
-                    trend_data = data.groupby(date_col)[numeric_col].mean().reset_index()
-                    
                     if len(trend_data) >= 2:
                         chart_data = {
                             "type": "line",
                             "title": f"{numeric_col} Trend Over Time",
                             "data": {
-                                "labels": [str(x) for x in trend_data[date_col].tolist()],
+                                "labels": labels,
                                 "datasets": [{
                                     "label": numeric_col,
-                                    "data": trend_data[numeric_col].tolist()
+                                    "data": trend_data[numeric_col].to_numpy().tolist()
                                 }]
                             }
                         }
@@ -718,28 +768,29 @@ Join: AGENT_NAME = ASSIGNEE_NAME"""
         
         if categorical_cols and numeric_cols:
             cat_col = categorical_cols[0]
+            metrics = numeric_cols[:2]  # Limit to 2 metrics
             
-            for numeric_col in numeric_cols[:2]:  # Limit to 2 metrics
+            try:
+                # Group by categorical column and aggregate every metric in one pass
+                grouped_data = data.groupby(cat_col)[metrics].mean()
+            except Exception as e:
+                logger.warning(f"Error generating comparison charts for {metrics}: {str(e)}")
+                return charts
+            
+            for numeric_col in metrics:
                 try:
-                    # Group by categorical column and aggregate
-                    comparison_data = data.groupby(cat_col)[numeric_col].mean().reset_index()
-                    
-                    # Sort by value for better visualization
-                    comparison_data = comparison_data.sort_values(numeric_col, ascending=False)
-                    
-                    # Limit to top 10 categories
-                    if len(comparison_data) > 10:
-                        comparison_data = comparison_data.head(10)
+                    # Sort by value for better visualization, limited to top 10 categories
+                    comparison_data = grouped_data[numeric_col].sort_values(ascending=False).head(10)
                     
                     if len(comparison_data) >= 2:
                         chart_data = {
                             "type": "bar",
                             "title": f"{numeric_col} by {cat_col}",
                             "data": {
-                                "labels": comparison_data[cat_col].tolist(),
+                                "labels": comparison_data.index.to_numpy().tolist(),
                                 "datasets": [{
                                     "label": numeric_col,
-                                    "data": comparison_data[numeric_col].tolist()
+                                    "data": comparison_data.to_numpy().tolist()
                                 }]
                             }
                         }
@@ -758,18 +809,18 @@ Join: AGENT_NAME = ASSIGNEE_NAME"""
             cat_col = categorical_cols[0]
             
             try:
-                # Count occurrences of each category
-                distribution_data = data[cat_col].value_counts().head(8)  # Top 8 categories
+                # Count occurrences of each category, then pick the top 8 without sorting every count
+                distribution_data = data[cat_col].value_counts(sort=False).nlargest(8)
                 
                 if len(distribution_data) >= 2:
                     chart_data = {
                         "type": "doughnut",
                         "title": f"Distribution by {cat_col}",
                         "data": {
-                            "labels": distribution_data.index.tolist(),
+                            "labels": distribution_data.index.to_numpy().tolist(),
                             "datasets": [{
                                 "label": "Count",
-                                "data": distribution_data.values.tolist()
+                                "data": distribution_data.to_numpy().tolist()
                             }]
                         }
                     }
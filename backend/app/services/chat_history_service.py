@@ -1,24 +1,61 @@
+import os
 import sqlite3
-import json
+import threading
 import uuid
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 from pathlib import Path
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# Random bytes for message/session ids, refilled 4 KiB at a time instead of one urandom call per id
+_RAND_POOL = bytearray()
+_RAND_POOL_LOCK = threading.Lock()
+# A forked worker must never hand out the same ids as its parent
+os.register_at_fork(after_in_child=_RAND_POOL.clear)
+
+
+def _fast_uuid() -> str:
+    """Random (version 4) UUID string drawn from the pooled bytes"""
+    with _RAND_POOL_LOCK:
+        if len(_RAND_POOL) < 16:
+            _RAND_POOL.extend(os.urandom(4096))
+        raw = bytes(_RAND_POOL[:16])
+        del _RAND_POOL[:16]
+    return str(uuid.UUID(bytes=raw, version=4))
+
+
 class ChatHistoryService:
     """Service for managing chat history and user sessions"""
     
     def __init__(self, db_path: str = "chat_history.db"):
         self.db_path = Path(db_path)
+        # One long-lived connection per thread (history writes run in worker threads)
+        self._local = threading.local()
         self._init_database()
     
+    @contextmanager
+    def _connect(self):
+        """Yield this thread's connection, committing on success and rolling back on error"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        
+        with conn:
+            yield conn
+    
     def _init_database(self):
         """Initialize SQLite database for chat history"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 # Users table
@@ -66,9 +103,12 @@ class ChatHistoryService:
                 
                 # Create indexes for better performance
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_session_role ON messages (session_id, role)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_user ON messages (user_id)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_created ON messages (created_at)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON chat_sessions (user_id)")
+                # Partial covering index: feedback stats only ever read rated messages
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_rating ON messages (created_at, feedback_rating) WHERE feedback_rating IS NOT NULL")
                 
                 conn.commit()
                 logger.info("Chat history database initialized successfully")
@@ -80,16 +120,16 @@ class ChatHistoryService:
     def create_user_session(self, user_metadata: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
         """Create a new user and session"""
         try:
-            user_id = str(uuid.uuid4())
-            session_id = str(uuid.uuid4())
+            user_id = _fast_uuid()
+            session_id = _fast_uuid()
             
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 # Create user
                 cursor.execute(
                     "INSERT INTO users (user_id, session_id, metadata) VALUES (?, ?, ?)",
-                    (user_id, session_id, json.dumps(user_metadata or {}))
+                    (user_id, session_id, orjson.dumps(user_metadata or {}).decode())
                 )
                 
                 # Create initial session
@@ -111,7 +151,7 @@ class ChatHistoryService:
         """Get existing user by session ID or create new one"""
         if session_id:
             try:
-                with sqlite3.connect(self.db_path) as conn:
+                with self._connect() as conn:
                     cursor = conn.cursor()
                     cursor.execute(
                         "SELECT user_id, session_id FROM users WHERE session_id = ?",
@@ -142,15 +182,18 @@ class ChatHistoryService:
         content: str,
         query_results: Optional[Dict[str, Any]] = None,
         insights: Optional[List[str]] = None,
-        sql_query: Optional[str] = None
+        sql_query: Optional[str] = None,
+        message_id: Optional[str] = None
     ) -> str:
         """Save a message to chat history"""
         try:
-            message_id = str(uuid.uuid4())
+            message_id = message_id or _fast_uuid()
             
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
+                # Take the write lock up front so the insert and session update share one commit
+                cursor.execute("BEGIN IMMEDIATE")
                 cursor.execute("""
                     INSERT INTO messages (
                         message_id, session_id, user_id, role, content, 
@@ -158,31 +201,19 @@ class ChatHistoryService:
                     ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
                     message_id, session_id, user_id, role, content,
-                    json.dumps(query_results) if query_results else None,
-                    json.dumps(insights) if insights else None,
+                    orjson.dumps(query_results, option=orjson.OPT_SERIALIZE_NUMPY, default=str).decode() if query_results else None,
+                    orjson.dumps(insights).decode() if insights else None,
                     sql_query
                 ))
                 
                 # Update session last message time and generate title if first message
                 if role == 'user':
+                    # Only a session still carrying the default title gets one from this message
+                    title = content[:50] + "..." if len(content) > 50 else content
                     cursor.execute(
-                        "SELECT COUNT(*) FROM messages WHERE session_id = ? AND role = 'user'",
-                        (session_id,)
+                        "UPDATE chat_sessions SET title = CASE WHEN title = 'New Chat' THEN ? ELSE title END, last_message_at = CURRENT_TIMESTAMP WHERE session_id = ?",
+                        (title, session_id)
                     )
-                    user_message_count = cursor.fetchone()[0]
-                    
-                    if user_message_count == 1:  # First user message
-                        # Generate a title from the first few words
-                        title = content[:50] + "..." if len(content) > 50 else content
-                        cursor.execute(
-                            "UPDATE chat_sessions SET title = ?, last_message_at = CURRENT_TIMESTAMP WHERE session_id = ?",
-                            (title, session_id)
-                        )
-                    else:
-                        cursor.execute(
-                            "UPDATE chat_sessions SET last_message_at = CURRENT_TIMESTAMP WHERE session_id = ?",
-                            (session_id,)
-                        )
                 
                 conn.commit()
                 
@@ -196,7 +227,7 @@ class ChatHistoryService:
     def get_chat_history(self, user_id: str, session_id: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get chat history for a session"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -208,22 +239,20 @@ class ChatHistoryService:
                     LIMIT ?
                 """, (session_id, user_id, limit))
                 
-                messages = []
-                for row in cursor.fetchall():
-                    message = {
-                        "id": row[0],
-                        "role": row[1],
-                        "content": row[2],
-                        "query_results": json.loads(row[3]) if row[3] else None,
-                        "insights": json.loads(row[4]) if row[4] else None,
-                        "sql_query": row[5],
-                        "feedback_rating": row[6],
-                        "feedback_comment": row[7],
-                        "timestamp": row[8]
+                return [
+                    {
+                        "id": row["message_id"],
+                        "role": row["role"],
+                        "content": row["content"],
+                        "query_results": orjson.loads(row["query_results"]) if row["query_results"] else None,
+                        "insights": orjson.loads(row["insights"]) if row["insights"] else None,
+                        "sql_query": row["sql_query"],
+                        "feedback_rating": row["feedback_rating"],
+                        "feedback_comment": row["feedback_comment"],
+                        "timestamp": row["created_at"]
                     }
-                    messages.append(message)
-                
-                return messages
+                    for row in cursor.fetchall()
+                ]
                 
         except Exception as e:
             logger.error(f"Failed to get chat history: {str(e)}")
@@ -232,16 +261,22 @@ class ChatHistoryService:
     def get_user_sessions(self, user_id: str) -> List[Dict[str, Any]]:
         """Get all sessions for a user"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
-                    SELECT session_id, title, created_at, last_message_at, is_active,
-                           (SELECT COUNT(*) FROM messages WHERE session_id = cs.session_id) as message_count
+                    SELECT cs.session_id, cs.title, cs.created_at, cs.last_message_at, cs.is_active,
+                           COALESCE(m.message_count, 0) as message_count
                     FROM chat_sessions cs
-                    WHERE user_id = ?
-                    ORDER BY last_message_at DESC
-                """, (user_id,))
+                    LEFT JOIN (
+                        SELECT session_id, COUNT(*) as message_count
+                        FROM messages
+                        WHERE user_id = ?
+                        GROUP BY session_id
+                    ) m ON m.session_id = cs.session_id
+                    WHERE cs.user_id = ?
+                    ORDER BY cs.last_message_at DESC
+                """, (user_id, user_id))
                 
                 sessions = []
                 for row in cursor.fetchall():
@@ -264,7 +299,7 @@ class ChatHistoryService:
     def add_feedback(self, message_id: str, rating: int, comment: Optional[str] = None):
         """Add feedback for a message"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute(
@@ -283,7 +318,7 @@ class ChatHistoryService:
     def get_feedback_stats(self, days: int = 30) -> Dict[str, Any]:
         """Get feedback statistics for the last N days"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute("""
@@ -294,8 +329,8 @@ class ChatHistoryService:
                         COUNT(CASE WHEN feedback_rating <= 2 THEN 1 END) as negative_ratings
                     FROM messages 
                     WHERE feedback_rating IS NOT NULL 
-                    AND created_at >= datetime('now', '-{} days')
-                """.format(days))
+                    AND created_at >= datetime('now', ?)
+                """, (f'-{int(days)} days',))
                 
                 result = cursor.fetchone()
                 
@@ -314,12 +349,13 @@ class ChatHistoryService:
     def cleanup_old_sessions(self, days: int = 90):
         """Clean up sessions older than N days"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 
                 # Mark old sessions as inactive
                 cursor.execute(
-                    "UPDATE chat_sessions SET is_active = FALSE WHERE last_message_at < datetime('now', '-{} days')".format(days)
+                    "UPDATE chat_sessions SET is_active = FALSE WHERE last_message_at < datetime('now', ?)",
+                    (f'-{int(days)} days',)
                 )
                 
                 deleted_count = cursor.rowcount
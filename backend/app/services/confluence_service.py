@@ -1,11 +1,17 @@
 import httpx
 import json
+import re
 from typing import Dict, Any, List, Optional
+from selectolax.parser import HTMLParser
 from ..core.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Regex fallback for markup the HTML parser rejects
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_WHITESPACE_RE = re.compile(r'\s+')
+
 class ConfluenceService:
     def __init__(self):
         self.base_url = settings.confluence_base_url
@@ -14,54 +20,67 @@ class ConfluenceService:
         
         if not all([self.base_url, self.api_token, self.username]):
             logger.warning("Confluence configuration incomplete. Some features may not work.")
+        
+        # Created on first use and kept open so requests reuse pooled keep-alive connections
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared Confluence client, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=f"{self.base_url}/rest/api",
+                auth=(self.username, self.api_token),
+                headers={
+                    'Accept': 'application/json',
+                    'Content-Type': 'application/json'
+                },
+                timeout=30.0,
+                limits=httpx.Limits(max_keepalive_connections=20)
+            )
+        return self._client
+    
+    async def aclose(self):
+        """Close the shared client (called on application shutdown)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
     async def _make_request(self, method: str, endpoint: str, params: Optional[Dict] = None, data: Optional[Dict] = None) -> Dict[str, Any]:
         """Make authenticated request to Confluence API"""
         if not self.base_url or not self.api_token:
             raise ValueError("Confluence not configured")
         
-        url = f"{self.base_url}/rest/api{endpoint}"
-        
-        auth = (self.username, self.api_token)
-        headers = {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json'
-        }
+        response = await self._get_client().request(
+            method=method,
+            url=endpoint,
+            params=params,
+            json=data
+        )
         
-        async with httpx.AsyncClient() as client:
-            response = await client.request(
-                method=method,
-                url=url,
-                auth=auth,
-                headers=headers,
-                params=params,
-                json=data,
-                timeout=30.0
-            )
-            
-            response.raise_for_status()
-            return response.json()
+        response.raise_for_status()
+        return response.json()
     
-    async def search_content(self, query: str, limit: int = 10, space_key: Optional[str] = None) -> List[Dict[str, Any]]:
+    async def search_content(self, query: str, limit: int = 10, space_key: Optional[str] = None, expand: str = 'body.storage,space,version') -> List[Dict[str, Any]]:
         """Search Confluence content"""
         try:
             params = {
                 'cql': f'text ~ "{query}"',
                 'limit': limit,
-                'expand': 'body.storage,space,version'
+                'expand': expand
             }
             
             if space_key:
                 params['cql'] += f' AND space = "{space_key}"'
             
             result = await self._make_request('GET', '/search', params=params)
+            page_url = f"{self.base_url}/pages/viewpage.action?pageId="
             
             return [
                 {
                     'id': item['id'],
                     'title': item['title'],
                     'type': item['type'],
-                    'url': f"{self.base_url}/pages/viewpage.action?pageId={item['id']}",
+                    'url': page_url + item['id'],
                     'space': item.get('space', {}).get('name', ''),
                     'content': self._extract_text_from_html(item.get('body', {}).get('storage', {}).get('value', '')),
                     'last_modified': item.get('version', {}).get('when', '')
@@ -104,13 +123,14 @@ class ConfluenceService:
         """Get available spaces"""
         try:
             result = await self._make_request('GET', '/space')
+            space_url = f"{self.base_url}/display/"
             
             return [
                 {
                     'key': space['key'],
                     'name': space['name'],
                     'type': space['type'],
-                    'url': f"{self.base_url}/display/{space['key']}"
+                    'url': space_url + space['key']
                 }
                 for space in result.get('results', [])
             ]
@@ -129,13 +149,14 @@ class ConfluenceService:
             }
             
             result = await self._make_request('GET', '/content', params=params)
+            page_url = f"{self.base_url}/pages/viewpage.action?pageId="
             
             return [
                 {
                     'id': item['id'],
                     'title': item['title'],
                     'type': item['type'],
-                    'url': f"{self.base_url}/pages/viewpage.action?pageId={item['id']}",
+                    'url': page_url + item['id'],
                     'content': self._extract_text_from_html(item.get('body', {}).get('storage', {}).get('value', '')),
                     'last_modified': item.get('version', {}).get('when', '')
                 }
@@ -149,14 +170,18 @@ class ConfluenceService:
     def _extract_text_from_html(self, html_content: str) -> str:
         """Extract plain text from Confluence HTML content"""
         try:
-            # Simple HTML tag removal - in production, use a proper HTML parser
-            import re
+            # Parse with lexbor (C) and collapse whitespace in the same pass
+            return ' '.join(HTMLParser(html_content).text(separator=' ').split())
             
+        except Exception as e:
+            logger.warning(f"HTML parser failed, falling back to regex extraction: {str(e)}")
+        
+        try:
             # Remove HTML tags
-            text = re.sub(r'<[^>]+>', '', html_content)
+            text = _HTML_TAG_RE.sub('', html_content)
             
             # Clean up whitespace
-            text = re.sub(r'\s+', ' ', text).strip()
+            text = _WHITESPACE_RE.sub(' ', text).strip()
             
             return text
             
@@ -167,7 +192,8 @@ class ConfluenceService:
     async def get_context_for_query(self, query: str, max_results: int = 5) -> str:
         """Get relevant Confluence content as context for AI queries"""
         try:
-            search_results = await self.search_content(query, limit=max_results)
+            # One search returns every body at once; version history isn't used in the context
+            search_results = await self.search_content(query, limit=max_results, expand='body.storage,space')
             
             if not search_results:
                 return ""
@@ -3,19 +3,198 @@ AWS-Ready Email Verification Service
 Handles email verification, password resets, and email notifications using AWS SES and DynamoDB
 """
 
+import asyncio
+import base64
+import json
 import logging
-import boto3
+import re
 import secrets
 import hashlib
-from datetime import datetime, timedelta, timezone
-from typing import Optional, Dict, Any
+import hmac
+import time
+from datetime import datetime, timezone
+from email import message_from_string
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple
 from uuid import uuid4
 import os
+from boto3.dynamodb.types import TypeDeserializer
 from botocore.exceptions import ClientError, NoCredentialsError
 from email_validator import validate_email, EmailNotValidError
+from ..core.aws_clients import get_session, get_ses_client, get_dynamodb_resource
 
 logger = logging.getLogger(__name__)
 
+# Same output as secrets.token_urlsafe, without its str round-trip
+_b64encode = base64.urlsafe_b64encode
+
+# Conditional-check failures return the old item in low-level attribute-value form
+_deserializer = TypeDeserializer()
+
+# Cheap shape check that rejects most malformed addresses before the full validator runs
+_EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+@lru_cache(maxsize=4096)
+def _is_valid_email(email: str) -> bool:
+    """Syntax-only validation; deliverability (DNS MX) is left to SES"""
+    if not _EMAIL_RE.match(email):
+        return False
+    try:
+        validate_email(email, check_deliverability=False)
+        return True
+    except EmailNotValidError:
+        return False
+
+
+def _emails_match(stored: str, email: str) -> bool:
+    """Constant-time email comparison; compare_digest rejects non-ASCII str, so compare bytes"""
+    return hmac.compare_digest(stored.encode('utf-8'), email.encode('utf-8'))
+
+# Email bodies are registered once as SES templates, so each send only carries the URL;
+# SendBulkTemplatedEmail accepts at most 50 destinations per call
+_SES_BULK_LIMIT = 50
+_SES_TEMPLATE_NAME_RE = re.compile(r'[^A-Za-z0-9_-]')
+
+_VERIFY_HTML_TEMPLATE = """
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <meta charset="utf-8">
+                <meta name="viewport" content="width=device-width, initial-scale=1.0">
+                <title>Verify Your Email</title>
+                <style>
+                    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
+                    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+                    .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
+                    .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
+                    .button {{ display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
+                    .footer {{ text-align: center; margin-top: 30px; color: #666; font-size: 14px; }}
+                </style>
+            </head>
+            <body>
+                <div class="container">
+                    <div class="header">
+                        <h1>Welcome to WOPS AI!</h1>
+                        <p>Please verify your email address to complete registration</p>
+                    </div>
+                    <div class="content">
+                        <h2>Email Verification Required</h2>
+                        <p>Thank you for registering with WOPS AI. To complete your account setup and start using our AI-powered business intelligence platform, please verify your email address.</p>
+                        
+                        <p><a href="{url}" class="button">Verify My Email</a></p>
+                        
+                        <p>If the button doesn't work, copy and paste this link into your browser:</p>
+                        <p style="word-break: break-all; background: #e9ecef; padding: 10px; border-radius: 5px; font-family: monospace;">{url}</p>
+                        
+                        <p><strong>This verification link will expire in {hours} hours.</strong></p>
+                        
+                        <hr style="margin: 30px 0; border: none; border-top: 1px solid #ddd;">
+                        
+                        <h3>What's Next?</h3>
+                        <ul>
+                            <li>Access powerful AI-driven business analytics</li>
+                            <li>Generate insights from your operational data</li>
+                            <li>Create custom reports and visualizations</li>
+                            <li>Collaborate with your team on data analysis</li>
+                        </ul>
+                    </div>
+                    <div class="footer">
+                        <p>If you didn't create an account with WOPS AI, please ignore this email.</p>
+                        <p>&copy; 2024 WOPS AI. All rights reserved.</p>
+                    </div>
+                </div>
+            </body>
+            </html>
+            """
+
+_VERIFY_TEXT_TEMPLATE = """
+            Welcome to WOPS AI!
+            
+            Thank you for registering with WOPS AI. To complete your account setup, please verify your email address by clicking the link below:
+            
+            {url}
+            
+            This verification link will expire in {hours} hours.
+            
+            If you didn't create an account with WOPS AI, please ignore this email.
+            
+            Best regards,
+            The WOPS AI Team
+            """
+
+_RESET_HTML_TEMPLATE = """
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <meta charset="utf-8">
+                <meta name="viewport" content="width=device-width, initial-scale=1.0">
+                <title>Reset Your Password</title>
+                <style>
+                    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
+                    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+                    .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
+                    .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
+                    .button {{ display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
+                    .footer {{ text-align: center; margin-top: 30px; color: #666; font-size: 14px; }}
+                    .warning {{ background: #fff3cd; border: 1px solid #ffeaa7; color: #856404; padding: 15px; border-radius: 5px; margin: 20px 0; }}
+                </style>
+            </head>
+            <body>
+                <div class="container">
+                    <div class="header">
+                        <h1>Password Reset Request</h1>
+                        <p>Reset your WOPS AI account password</p>
+                    </div>
+                    <div class="content">
+                        <h2>Password Reset</h2>
+                        <p>We received a request to reset the password for your WOPS AI account. If you made this request, click the button below to reset your password.</p>
+                        
+                        <p><a href="{url}" class="button">Reset My Password</a></p>
+                        
+                        <p>If the button doesn't work, copy and paste this link into your browser:</p>
+                        <p style="word-break: break-all; background: #e9ecef; padding: 10px; border-radius: 5px; font-family: monospace;">{url}</p>
+                        
+                        <div class="warning">
+                            <strong>⚠️ Important Security Information:</strong>
+                            <ul>
+                                <li>This reset link will expire in {hours} hour(s)</li>
+                                <li>The link can only be used once</li>
+                                <li>If you didn't request this reset, please ignore this email</li>
+                                <li>Your password will remain unchanged until you create a new one</li>
+                            </ul>
+                        </div>
+                        
+                        <hr style="margin: 30px 0; border: none; border-top: 1px solid #ddd;">
+                        
+                        <h3>Need Help?</h3>
+                        <p>If you're having trouble with password reset, please contact our support team.</p>
+                    </div>
+                    <div class="footer">
+                        <p>If you didn't request a password reset, please ignore this email or contact support if you have concerns.</p>
+                        <p>&copy; 2024 WOPS AI. All rights reserved.</p>
+                    </div>
+                </div>
+            </body>
+            </html>
+            """
+
+_RESET_TEXT_TEMPLATE = """
+            Password Reset Request - WOPS AI
+            
+            We received a request to reset the password for your WOPS AI account.
+            
+            If you made this request, click the link below to reset your password:
+            {url}
+            
+            This reset link will expire in {hours} hour(s) and can only be used once.
+            
+            If you didn't request this password reset, please ignore this email. Your password will remain unchanged.
+            
+            Best regards,
+            The WOPS AI Team
+            """
+
 class EmailVerificationService:
     """
     Production-ready email verification service using AWS SES and DynamoDB
@@ -35,18 +214,43 @@ class EmailVerificationService:
         self.verification_expiry_hours = int(os.getenv('VERIFICATION_EXPIRY_HOURS', '24'))
         self.password_reset_expiry_hours = int(os.getenv('PASSWORD_RESET_EXPIRY_HOURS', '1'))
         
+        # SES templates are account-wide, so name them after this deployment's tables
+        self.verify_template_name = _SES_TEMPLATE_NAME_RE.sub('-', f"{self.verification_table}-email")[:64]
+        self.reset_template_name = _SES_TEMPLATE_NAME_RE.sub('-', f"{self.password_reset_table}-email")[:64]
+        
         # Initialize AWS clients
         self._init_aws_clients()
-        self._create_dynamodb_tables()
+        
+        # Deployed environments create the tables once via bootstrap_tables() instead of on every start
+        if not os.getenv('SKIP_TABLE_BOOTSTRAP'):
+            self._create_dynamodb_tables()
+            # Refuse to serve against tables that still have the old key schema
+            self._check_key_schemas()
+        
+        self._bind_tables()
+    
+    def _bind_tables(self):
+        """Point the item-level table handles at DAX when enabled, otherwise at DynamoDB"""
+        # Table handles are lazy; no DescribeTable round-trip until the first real request
+        self.verification_table_resource = self.item_store.Table(self.verification_table)
+        self.password_reset_table_resource = self.item_store.Table(self.password_reset_table)
     
     def _init_aws_clients(self):
         """Initialize AWS SES and DynamoDB clients"""
         try:
-            # Use IAM roles in production, access keys in development
-            session = boto3.Session(region_name=self.aws_region)
-            
-            self.ses_client = session.client('ses')
-            self.dynamodb = session.resource('dynamodb')
+            # Use IAM roles in production, access keys in development; the session and its
+            # connection pools are shared with the other AWS-backed services
+            session = get_session()
+            self.ses_client = get_ses_client()
+            self.dynamodb = get_dynamodb_resource()
+            
+            # Item reads and writes can go through the DAX write-through cache; table
+            # management always talks to DynamoDB directly
+            self.item_store = self.dynamodb
+            if os.getenv('USE_DAX', 'false').lower() == 'true':
+                from amazondax import AmazonDaxClient
+                self.item_store = AmazonDaxClient.resource(session=session, endpoints=[os.getenv('DAX_ENDPOINT')])
+                logger.info("Using DAX for verification and password reset tokens")
             
             logger.info("AWS clients initialized successfully")
             
@@ -70,31 +274,16 @@ class EmailVerificationService:
                     self.verification_table_resource = self.dynamodb.create_table(
                         TableName=self.verification_table,
                         KeySchema=[
-                            {'AttributeName': 'email', 'KeyType': 'HASH'},
-                            {'AttributeName': 'token', 'KeyType': 'RANGE'}
+                            {'AttributeName': 'token', 'KeyType': 'HASH'}
                         ],
                         AttributeDefinitions=[
-                            {'AttributeName': 'email', 'AttributeType': 'S'},
-                            {'AttributeName': 'token', 'AttributeType': 'S'},
-                            {'AttributeName': 'expires_at', 'AttributeType': 'N'}
-                        ],
-                        BillingMode='PAY_PER_REQUEST',
-                        GlobalSecondaryIndexes=[
-                            {
-                                'IndexName': 'token-index',
-                                'KeySchema': [
-                                    {'AttributeName': 'token', 'KeyType': 'HASH'}
-                                ],
-                                'Projection': {'ProjectionType': 'ALL'}
-                            }
+                            {'AttributeName': 'token', 'AttributeType': 'S'}
                         ],
-                        TimeToLiveSpecification={
-                            'AttributeName': 'expires_at',
-                            'Enabled': True
-                        }
+                        BillingMode='PAY_PER_REQUEST'
                     )
                     # Wait for table to be created
                     self.verification_table_resource.wait_until_exists()
+                    self._enable_ttl(self.verification_table)
                     logger.info(f"{self.verification_table} table created successfully")
             
             # Password reset table
@@ -107,52 +296,126 @@ class EmailVerificationService:
                     self.password_reset_table_resource = self.dynamodb.create_table(
                         TableName=self.password_reset_table,
                         KeySchema=[
-                            {'AttributeName': 'email', 'KeyType': 'HASH'},
-                            {'AttributeName': 'token', 'KeyType': 'RANGE'}
+                            {'AttributeName': 'token', 'KeyType': 'HASH'}
                         ],
                         AttributeDefinitions=[
-                            {'AttributeName': 'email', 'AttributeType': 'S'},
-                            {'AttributeName': 'token', 'AttributeType': 'S'},
-                            {'AttributeName': 'expires_at', 'AttributeType': 'N'}
+                            {'AttributeName': 'token', 'AttributeType': 'S'}
                         ],
-                        BillingMode='PAY_PER_REQUEST',
-                        GlobalSecondaryIndexes=[
-                            {
-                                'IndexName': 'token-index',
-                                'KeySchema': [
-                                    {'AttributeName': 'token', 'KeyType': 'HASH'}
-                                ],
-                                'Projection': {'ProjectionType': 'ALL'}
-                            }
-                        ],
-                        TimeToLiveSpecification={
-                            'AttributeName': 'expires_at',
-                            'Enabled': True
-                        }
+                        BillingMode='PAY_PER_REQUEST'
                     )
                     # Wait for table to be created
                     self.password_reset_table_resource.wait_until_exists()
+                    self._enable_ttl(self.password_reset_table)
                     logger.info(f"{self.password_reset_table} table created successfully")
                     
         except Exception as e:
             logger.error(f"Failed to create DynamoDB tables: {e}")
             raise
     
+    def _enable_ttl(self, table_name: str):
+        """Let DynamoDB expire tokens on expires_at; nothing in the app deletes them"""
+        self.dynamodb.meta.client.update_time_to_live(
+            TableName=table_name,
+            TimeToLiveSpecification={'AttributeName': 'expires_at', 'Enabled': True}
+        )
+    
+    def _check_key_schemas(self):
+        """Raise if a token table is not keyed by token alone (uses the tables loaded by _create_dynamodb_tables)"""
+        # Older deployments keyed tokens by (email, token) with a token-index GSI; the key
+        # schema cannot be changed in place, so those tables have to be recreated
+        for table in (self.verification_table_resource, self.password_reset_table_resource):
+            if [key['AttributeName'] for key in table.key_schema] != ['token']:
+                raise RuntimeError(f"{table.name} uses the old (email, token) key schema and must be recreated")
+    
+    def bootstrap_tables(self):
+        """Create the tables and SES templates if missing (run once at deploy time)"""
+        self._create_dynamodb_tables()
+        self._check_key_schemas()
+        
+        for table_name in (self.verification_table, self.password_reset_table):
+            ttl = self.dynamodb.meta.client.describe_time_to_live(TableName=table_name)['TimeToLiveDescription']
+            if ttl.get('TimeToLiveStatus') not in ('ENABLED', 'ENABLING'):
+                self._enable_ttl(table_name)
+        
+        self.register_ses_templates()
+        self._check_template_rendering()
+        self._bind_tables()
+    
+    def _check_template_rendering(self):
+        """Render both templates through SES and raise if a link does not come out verbatim"""
+        sample_url = f"{self.frontend_url}/check?token=abc&email=user@example.com"
+        for template_name, field in ((self.verify_template_name, 'verification_url'), (self.reset_template_name, 'reset_url')):
+            rendered = self.ses_client.test_render_template(
+                TemplateName=template_name, TemplateData=json.dumps({field: sample_url})
+            )['RenderedTemplate']
+            for part in message_from_string(rendered).walk():
+                if part.get_content_type() != 'text/plain':
+                    continue
+                text = part.get_payload(decode=True).decode(part.get_content_charset() or 'utf-8')
+                if sample_url not in text:
+                    raise RuntimeError(f"SES template {template_name} does not render {field} verbatim")
+    
+    def register_ses_templates(self, update: bool = True):
+        """Create the SES templates with the expiry baked in; bootstrap also refreshes existing ones"""
+        # Triple braces: SES templates are Handlebars, which would HTML-escape the '=' and '&'
+        # in the (server-built) URLs and break the plain-text link
+        templates = [
+            {
+                'TemplateName': self.verify_template_name,
+                'SubjectPart': "Verify Your WOPS AI Account",
+                'HtmlPart': _VERIFY_HTML_TEMPLATE.format(url='{{{verification_url}}}', hours=self.verification_expiry_hours),
+                'TextPart': _VERIFY_TEXT_TEMPLATE.format(url='{{{verification_url}}}', hours=self.verification_expiry_hours)
+            },
+            {
+                'TemplateName': self.reset_template_name,
+                'SubjectPart': "Reset Your WOPS AI Password",
+                'HtmlPart': _RESET_HTML_TEMPLATE.format(url='{{{reset_url}}}', hours=self.password_reset_expiry_hours),
+                'TextPart': _RESET_TEXT_TEMPLATE.format(url='{{{reset_url}}}', hours=self.password_reset_expiry_hours)
+            }
+        ]
+        for template in templates:
+            try:
+                self.ses_client.create_template(Template=template)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'AlreadyExists':
+                    raise
+                if update:
+                    self.ses_client.update_template(Template=template)
+    
+    async def _call_templated_ses(self, operation, **kwargs) -> Dict[str, Any]:
+        """Run a templated SES call, creating the templates once if bootstrap never registered them"""
+        try:
+            return await asyncio.to_thread(operation, **kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TemplateDoesNotExist':
+                raise
+        
+        logger.warning("SES templates missing; creating them now (run bootstrap_tables() at deploy time)")
+        await asyncio.to_thread(self.register_ses_templates, False)
+        return await asyncio.to_thread(operation, **kwargs)
+    
+    async def _send_templated_email(self, email: str, template: str, data: Dict[str, str]) -> str:
+        """Send one templated email and return the SES message id"""
+        response = await self._call_templated_ses(
+            self.ses_client.send_templated_email,
+            Source=self.ses_sender_email,
+            Destination={'ToAddresses': [email]},
+            Template=template,
+            TemplateData=json.dumps(data)
+        )
+        return response['MessageId']
+    
     def _generate_secure_token(self) -> str:
         """Generate a cryptographically secure verification token"""
-        return secrets.token_urlsafe(32)
+        return _b64encode(secrets.token_bytes(32)).rstrip(b'=').decode('ascii')
     
     def _hash_token(self, token: str) -> str:
         """Hash a token for secure storage"""
-        return hashlib.sha256(token.encode()).hexdigest()
+        return hashlib.blake2b(token.encode('ascii'), digest_size=32).hexdigest()
     
     def validate_email_address(self, email: str) -> bool:
         """Validate email address format"""
-        try:
-            validate_email(email)
-            return True
-        except EmailNotValidError:
-            return False
+        return _is_valid_email(email)
     
     async def send_verification_email(self, email: str, user_id: str) -> bool:
         """Send email verification email using AWS SES"""
@@ -164,16 +427,18 @@ class EmailVerificationService:
             # Generate verification token
             token = self._generate_secure_token()
             token_hash = self._hash_token(token)
-            expires_at = datetime.now(timezone.utc) + timedelta(hours=self.verification_expiry_hours)
+            now = time.time()
+            expires_at = int(now) + self.verification_expiry_hours * 3600
             
-            # Store verification token in DynamoDB
-            self.verification_table_resource.put_item(
+            # Store verification token in DynamoDB before sending, so the link is never dead
+            await asyncio.to_thread(
+                self.verification_table_resource.put_item,
                 Item={
                     'email': email,
                     'token': token_hash,
                     'user_id': user_id,
-                    'created_at': datetime.now(timezone.utc).isoformat(),
-                    'expires_at': int(expires_at.timestamp()),
+                    'created_at': datetime.fromtimestamp(now, timezone.utc).isoformat(),
+                    'expires_at': expires_at,
                     'verified': False
                 }
             )
@@ -181,89 +446,12 @@ class EmailVerificationService:
             # Create verification URL
             verification_url = f"{self.frontend_url}/verify-email?token={token}&email={email}"
             
-            # Email template
-            subject = "Verify Your WOPS AI Account"
-            html_body = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Verify Your Email</title>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                    .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-                    .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
-                    .button {{ display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
-                    .footer {{ text-align: center; margin-top: 30px; color: #666; font-size: 14px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>Welcome to WOPS AI!</h1>
-                        <p>Please verify your email address to complete registration</p>
-                    </div>
-                    <div class="content">
-                        <h2>Email Verification Required</h2>
-                        <p>Thank you for registering with WOPS AI. To complete your account setup and start using our AI-powered business intelligence platform, please verify your email address.</p>
-                        
-                        <p><a href="{verification_url}" class="button">Verify My Email</a></p>
-                        
-                        <p>If the button doesn't work, copy and paste this link into your browser:</p>
-                        <p style="word-break: break-all; background: #e9ecef; padding: 10px; border-radius: 5px; font-family: monospace;">{verification_url}</p>
-                        
-                        <p><strong>This verification link will expire in {self.verification_expiry_hours} hours.</strong></p>
-                        
-                        <hr style="margin: 30px 0; border: none; border-top: 1px solid #ddd;">
-                        
-                        <h3>What's Next?</h3>
-                        <ul>
-                            <li>Access powerful AI-driven business analytics</li>
-                            <li>Generate insights from your operational data</li>
-                            <li>Create custom reports and visualizations</li>
-                            <li>Collaborate with your team on data analysis</li>
-                        </ul>
-                    </div>
-                    <div class="footer">
-                        <p>If you didn't create an account with WOPS AI, please ignore this email.</p>
-                        <p>&copy; 2024 WOPS AI. All rights reserved.</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            text_body = f"""
-            Welcome to WOPS AI!
-            
-            Thank you for registering with WOPS AI. To complete your account setup, please verify your email address by clicking the link below:
-            
-            {verification_url}
-            
-            This verification link will expire in {self.verification_expiry_hours} hours.
-            
-            If you didn't create an account with WOPS AI, please ignore this email.
-            
-            Best regards,
-            The WOPS AI Team
-            """
-            
             # Send email via SES
-            response = self.ses_client.send_email(
-                Source=self.ses_sender_email,
-                Destination={'ToAddresses': [email]},
-                Message={
-                    'Subject': {'Data': subject, 'Charset': 'UTF-8'},
-                    'Body': {
-                        'Text': {'Data': text_body, 'Charset': 'UTF-8'},
-                        'Html': {'Data': html_body, 'Charset': 'UTF-8'}
-                    }
-                }
+            message_id = await self._send_templated_email(
+                email, self.verify_template_name, {'verification_url': verification_url}
             )
             
-            logger.info(f"Verification email sent successfully to {email}. Message ID: {response['MessageId']}")
+            logger.info(f"Verification email sent successfully to {email}. Message ID: {message_id}")
             return True
             
         except ClientError as e:
@@ -273,47 +461,119 @@ class EmailVerificationService:
             logger.error(f"Error sending verification email to {email}: {e}")
             return False
     
+    async def send_verification_emails_bulk(self, recipients: List[Tuple[str, str]]) -> int:
+        """Send verification emails to many (email, user_id) pairs; returns the number accepted by SES"""
+        try:
+            now = time.time()
+            created_at = datetime.fromtimestamp(now, timezone.utc).isoformat()
+            expires_at = int(now) + self.verification_expiry_hours * 3600
+            
+            items = []
+            destinations = []
+            for email, user_id in recipients:
+                if not self.validate_email_address(email):
+                    logger.warning(f"Skipping bulk verification email to invalid address {email}")
+                    continue
+                
+                token = self._generate_secure_token()
+                items.append({
+                    'email': email,
+                    'token': self._hash_token(token),
+                    'user_id': user_id,
+                    'created_at': created_at,
+                    'expires_at': expires_at,
+                    'verified': False
+                })
+                destinations.append({
+                    'Destination': {'ToAddresses': [email]},
+                    'ReplacementTemplateData': json.dumps({
+                        'verification_url': f"{self.frontend_url}/verify-email?token={token}&email={email}"
+                    })
+                })
+            
+            if not items:
+                return 0
+            
+            # batch_writer groups the puts into BatchWriteItem calls of up to 25 items
+            def write_tokens():
+                with self.verification_table_resource.batch_writer() as batch:
+                    for item in items:
+                        batch.put_item(Item=item)
+            
+            await asyncio.to_thread(write_tokens)
+            
+            sent = 0
+            for start in range(0, len(destinations), _SES_BULK_LIMIT):
+                response = await self._call_templated_ses(
+                    self.ses_client.send_bulk_templated_email,
+                    Source=self.ses_sender_email,
+                    Template=self.verify_template_name,
+                    DefaultTemplateData='{}',
+                    Destinations=destinations[start:start + _SES_BULK_LIMIT]
+                )
+                sent += sum(1 for status in response['Status'] if status.get('Status') == 'Success')
+            
+            logger.info(f"Bulk verification emails sent: {sent}/{len(destinations)}")
+            return sent
+            
+        except ClientError as e:
+            logger.error(f"SES error sending bulk verification emails: {e}")
+            return 0
+        except Exception as e:
+            logger.error(f"Error sending bulk verification emails: {e}")
+            return 0
+    
     async def verify_email_token(self, email: str, token: str) -> bool:
         """Verify email verification token"""
         try:
             token_hash = self._hash_token(token)
+            now = int(time.time())
             
-            # Get token from DynamoDB
-            response = self.verification_table_resource.get_item(
-                Key={'email': email, 'token': token_hash}
-            )
-            
-            if 'Item' not in response:
-                logger.warning(f"Verification token not found for email: {email}")
-                return False
-            
-            item = response['Item']
-            
-            # Check if token has expired
-            expires_at = datetime.fromtimestamp(item['expires_at'], tz=timezone.utc)
-            if datetime.now(timezone.utc) > expires_at:
-                logger.warning(f"Verification token expired for email: {email}")
-                # Clean up expired token
-                self.verification_table_resource.delete_item(
-                    Key={'email': email, 'token': token_hash}
+            # Check and mark as verified in one conditional write; on failure DynamoDB
+            # returns the stored item so we can tell why
+            try:
+                await asyncio.to_thread(
+                    self.verification_table_resource.update_item,
+                    Key={'token': token_hash},
+                    UpdateExpression='SET verified = :verified, verified_at = :verified_at',
+                    ConditionExpression=(
+                        'attribute_exists(#token) AND email = :email AND expires_at >= :now '
+                        'AND (verified = :unverified OR attribute_not_exists(verified))'
+                    ),
+                    ExpressionAttributeNames={'#token': 'token'},
+                    ExpressionAttributeValues={
+                        ':verified': True,
+                        ':unverified': False,
+                        ':verified_at': datetime.fromtimestamp(now, timezone.utc).isoformat(),
+                        ':email': email,
+                        ':now': now
+                    },
+                    ReturnValuesOnConditionCheckFailure='ALL_OLD'
                 )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                
+                if 'Item' not in e.response:
+                    logger.warning(f"Verification token not found for email: {email}")
+                    return False
+                
+                item = {k: _deserializer.deserialize(v) for k, v in e.response['Item'].items()}
+                
+                # The token is the key, so make sure it was issued for this address
+                if not _emails_match(item.get('email', ''), email):
+                    logger.warning(f"Verification token does not match email: {email}")
+                    return False
+                
+                # An already-verified token succeeds regardless of expiry
+                if item.get('verified', False):
+                    logger.warning(f"Email already verified: {email}")
+                    return True
+                
+                # Otherwise the token has expired (TTL removes it)
+                logger.warning(f"Verification token expired for email: {email}")
                 return False
             
-            # Check if already verified
-            if item.get('verified', False):
-                logger.warning(f"Email already verified: {email}")
-                return True
-            
-            # Mark as verified
-            self.verification_table_resource.update_item(
-                Key={'email': email, 'token': token_hash},
-                UpdateExpression='SET verified = :verified, verified_at = :verified_at',
-                ExpressionAttributeValues={
-                    ':verified': True,
-                    ':verified_at': datetime.now(timezone.utc).isoformat()
-                }
-            )
-            
             logger.info(f"Email successfully verified: {email}")
             return True
             
@@ -331,16 +591,18 @@ class EmailVerificationService:
             # Generate reset token
             token = self._generate_secure_token()
             token_hash = self._hash_token(token)
-            expires_at = datetime.now(timezone.utc) + timedelta(hours=self.password_reset_expiry_hours)
+            now = time.time()
+            expires_at = int(now) + self.password_reset_expiry_hours * 3600
             
-            # Store reset token in DynamoDB
-            self.password_reset_table_resource.put_item(
+            # Store reset token in DynamoDB before sending, so the link is never dead
+            await asyncio.to_thread(
+                self.password_reset_table_resource.put_item,
                 Item={
                     'email': email,
                     'token': token_hash,
                     'user_id': user_id,
-                    'created_at': datetime.now(timezone.utc).isoformat(),
-                    'expires_at': int(expires_at.timestamp()),
+                    'created_at': datetime.fromtimestamp(now, timezone.utc).isoformat(),
+                    'expires_at': expires_at,
                     'used': False
                 }
             )
@@ -348,94 +610,12 @@ class EmailVerificationService:
             # Create reset URL
             reset_url = f"{self.frontend_url}/reset-password?token={token}&email={email}"
             
-            # Email template
-            subject = "Reset Your WOPS AI Password"
-            html_body = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                <title>Reset Your Password</title>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                    .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-                    .content {{ background: #f9f9f9; padding: 30px; border-radius: 0 0 10px 10px; }}
-                    .button {{ display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 30px; text-decoration: none; border-radius: 5px; margin: 20px 0; }}
-                    .footer {{ text-align: center; margin-top: 30px; color: #666; font-size: 14px; }}
-                    .warning {{ background: #fff3cd; border: 1px solid #ffeaa7; color: #856404; padding: 15px; border-radius: 5px; margin: 20px 0; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>Password Reset Request</h1>
-                        <p>Reset your WOPS AI account password</p>
-                    </div>
-                    <div class="content">
-                        <h2>Password Reset</h2>
-                        <p>We received a request to reset the password for your WOPS AI account. If you made this request, click the button below to reset your password.</p>
-                        
-                        <p><a href="{reset_url}" class="button">Reset My Password</a></p>
-                        
-                        <p>If the button doesn't work, copy and paste this link into your browser:</p>
-                        <p style="word-break: break-all; background: #e9ecef; padding: 10px; border-radius: 5px; font-family: monospace;">{reset_url}</p>
-                        
-                        <div class="warning">
-                            <strong>⚠️ Important Security Information:</strong>
-                            <ul>
-                                <li>This reset link will expire in {self.password_reset_expiry_hours} hour(s)</li>
-                                <li>The link can only be used once</li>
-                                <li>If you didn't request this reset, please ignore this email</li>
-                                <li>Your password will remain unchanged until you create a new one</li>
-                            </ul>
-                        </div>
-                        
-                        <hr style="margin: 30px 0; border: none; border-top: 1px solid #ddd;">
-                        
-                        <h3>Need Help?</h3>
-                        <p>If you're having trouble with password reset, please contact our support team.</p>
-                    </div>
-                    <div class="footer">
-                        <p>If you didn't request a password reset, please ignore this email or contact support if you have concerns.</p>
-                        <p>&copy; 2024 WOPS AI. All rights reserved.</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            text_body = f"""
-            Password Reset Request - WOPS AI
-            
-            We received a request to reset the password for your WOPS AI account.
-            
-            If you made this request, click the link below to reset your password:
-            {reset_url}
-            
-            This reset link will expire in {self.password_reset_expiry_hours} hour(s) and can only be used once.
-            
-            If you didn't request this password reset, please ignore this email. Your password will remain unchanged.
-            
-            Best regards,
-            The WOPS AI Team
-            """
-            
             # Send email via SES
-            response = self.ses_client.send_email(
-                Source=self.ses_sender_email,
-                Destination={'ToAddresses': [email]},
-                Message={
-                    'Subject': {'Data': subject, 'Charset': 'UTF-8'},
-                    'Body': {
-                        'Text': {'Data': text_body, 'Charset': 'UTF-8'},
-                        'Html': {'Data': html_body, 'Charset': 'UTF-8'}
-                    }
-                }
+            message_id = await self._send_templated_email(
+                email, self.reset_template_name, {'reset_url': reset_url}
             )
             
-            logger.info(f"Password reset email sent successfully to {email}. Message ID: {response['MessageId']}")
+            logger.info(f"Password reset email sent successfully to {email}. Message ID: {message_id}")
             return True
             
         except ClientError as e:
@@ -451,8 +631,9 @@ class EmailVerificationService:
             token_hash = self._hash_token(token)
             
             # Get token from DynamoDB
-            response = self.password_reset_table_resource.get_item(
-                Key={'email': email, 'token': token_hash}
+            response = await asyncio.to_thread(
+                self.password_reset_table_resource.get_item,
+                Key={'token': token_hash}
             )
             
             if 'Item' not in response:
@@ -461,14 +642,9 @@ class EmailVerificationService:
             
             item = response['Item']
             
-            # Check if token has expired
-            expires_at = datetime.fromtimestamp(item['expires_at'], tz=timezone.utc)
-            if datetime.now(timezone.utc) > expires_at:
-                logger.warning(f"Password reset token expired for email: {email}")
-                # Clean up expired token
-                self.password_reset_table_resource.delete_item(
-                    Key={'email': email, 'token': token_hash}
-                )
+            # The token is the key, so make sure it was issued for this address
+            if not _emails_match(item['email'], email):
+                logger.warning(f"Password reset token does not match email: {email}")
                 return None
             
             # Check if token has been used
@@ -476,6 +652,11 @@ class EmailVerificationService:
                 logger.warning(f"Password reset token already used for email: {email}")
                 return None
             
+            # Check if token has expired
+            if item['expires_at'] < int(time.time()):
+                logger.warning(f"Password reset token expired for email: {email}")
+                return None
+            
             logger.info(f"Password reset token verified for email: {email}")
             return item['user_id']
             
@@ -489,12 +670,15 @@ class EmailVerificationService:
             token_hash = self._hash_token(token)
             
             # Mark token as used
-            self.password_reset_table_resource.update_item(
-                Key={'email': email, 'token': token_hash},
+            await asyncio.to_thread(
+                self.password_reset_table_resource.update_item,
+                Key={'token': token_hash},
                 UpdateExpression='SET used = :used, used_at = :used_at',
+                ConditionExpression='email = :email',
                 ExpressionAttributeValues={
                     ':used': True,
-                    ':used_at': datetime.now(timezone.utc).isoformat()
+                    ':used_at': datetime.now(timezone.utc).isoformat(),
+                    ':email': email
                 }
             )
             
@@ -504,17 +688,19 @@ class EmailVerificationService:
         except Exception as e:
             logger.error(f"Error marking password reset token as used for {email}: {e}")
             return False
-    
-    async def cleanup_expired_tokens(self):
-        """Clean up expired tokens (this would typically be run as a scheduled job)"""
-        try:
-            current_time = int(datetime.now(timezone.utc).timestamp())
-            
-            # DynamoDB TTL should handle this automatically, but we can add manual cleanup if needed
-            logger.info("Token cleanup completed")
-            
-        except Exception as e:
-            logger.error(f"Error during token cleanup: {e}")
 
-# Global instance
-email_verification_service = EmailVerificationService()
\ No newline at end of file
+# Created on first use so importing this module doesn't open AWS sessions or touch DynamoDB
+_email_verification_service: Optional[EmailVerificationService] = None
+
+
+def get_email_verification_service() -> EmailVerificationService:
+    """Return the shared service, creating it on first call"""
+    global _email_verification_service
+    if _email_verification_service is None:
+        _email_verification_service = EmailVerificationService()
+    return _email_verification_service
+
+
+if __name__ == "__main__":
+    # python -m app.services.email_verification_service
+    get_email_verification_service().bootstrap_tables()
@@ -1,16 +1,33 @@
 import aiofiles
+import asyncio
 import hashlib
 import json
 import os
 import pandas as pd
+import sqlite3
+import threading
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import uuid
 from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+# Metadata files are small; one threadpool hop per read/write beats aiofiles' per-call dispatch
+def _sync_write_json(path: Path, obj: Dict[str, Any]):
+    path.write_text(json.dumps(obj))
+
+
+def _sync_read_json(path: Path) -> Dict[str, Any]:
+    return json.loads(path.read_text())
+
+
+def _sha256_hex(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
 class FileService:
     def __init__(self):
         self.upload_dir = Path("uploads")
@@ -19,6 +36,112 @@ class FileService:
         # File metadata storage (in production, use a database)
         self.metadata_dir = Path("metadata")
         self.metadata_dir.mkdir(exist_ok=True)
+        
+        # Append-only summary index so listing, counting and search skip parsing every metadata file
+        self.index_path = self.metadata_dir / "_index.jsonl"
+        self._compact_index()
+        
+        # Content hash -> stored blob, so duplicate uploads share one file on disk
+        self._hash_db = sqlite3.connect(self.metadata_dir / "_hash_index.db", check_same_thread=False, isolation_level=None)
+        self._hash_lock = threading.Lock()
+        self._hash_db.execute("PRAGMA journal_mode=WAL")
+        self._hash_db.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                sha256 TEXT PRIMARY KEY,
+                file_id TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                refs INTEGER NOT NULL DEFAULT 1
+            )
+        """)
+    
+    def _claim_blob(self, file_hash: str, suffix: str) -> Optional[Tuple[str, str]]:
+        """Return (file_id, file_path) of a stored blob with this hash and add a reference to it"""
+        with self._hash_lock:
+            row = self._hash_db.execute(
+                "SELECT file_id, file_path FROM hashes WHERE sha256 = ?", (file_hash,)
+            ).fetchone()
+            # Text extraction depends on the extension, so only share blobs of the same type
+            if row is None or Path(row[1]).suffix.lower() != suffix or not Path(row[1]).exists():
+                return None
+            self._hash_db.execute("UPDATE hashes SET refs = refs + 1 WHERE sha256 = ?", (file_hash,))
+            return row
+    
+    def _register_blob(self, file_hash: str, file_id: str, file_path: str):
+        """Record a newly written blob; the first upload of some content wins while its blob exists"""
+        with self._hash_lock:
+            row = self._hash_db.execute(
+                "SELECT file_path FROM hashes WHERE sha256 = ?", (file_hash,)
+            ).fetchone()
+            # A live blob of another type keeps its row; this one stays unshared
+            if row is not None and Path(row[0]).exists():
+                return
+            # No row, or one left behind by a blob that is gone: point it at this blob
+            self._hash_db.execute(
+                """
+                INSERT INTO hashes (sha256, file_id, file_path) VALUES (?, ?, ?)
+                ON CONFLICT(sha256) DO UPDATE SET
+                    file_id = excluded.file_id, file_path = excluded.file_path, refs = 1
+                """,
+                (file_hash, file_id, file_path)
+            )
+    
+    def _release_blob(self, file_hash: Optional[str], file_path: Path):
+        """Drop one reference to a blob and delete it from disk once nothing points at it"""
+        with self._hash_lock:
+            row = self._hash_db.execute(
+                "SELECT file_path, refs FROM hashes WHERE sha256 = ?", (file_hash,)
+            ).fetchone()
+            if row is not None and row[0] == str(file_path):
+                if row[1] > 1:
+                    self._hash_db.execute("UPDATE hashes SET refs = refs - 1 WHERE sha256 = ?", (file_hash,))
+                    return
+                self._hash_db.execute("DELETE FROM hashes WHERE sha256 = ?", (file_hash,))
+        
+        if file_path.exists():
+            file_path.unlink()
+    
+    def _append_index(self, record: Dict[str, Any]):
+        """Append one summary or tombstone record (a single O_APPEND write is atomic)"""
+        fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps(record) + "\n").encode("utf-8"))
+        finally:
+            os.close(fd)
+    
+    def _read_index(self) -> Dict[str, Dict[str, Any]]:
+        """Live summaries by file_id in upload order; later records win and tombstones remove"""
+        entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.index_path, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn write from a crash
+                    if record.get("deleted"):
+                        entries.pop(record["file_id"], None)
+                    else:
+                        entries[record["file_id"]] = record
+        except FileNotFoundError:
+            pass
+        return entries
+    
+    def _compact_index(self):
+        """Rewrite the index without superseded records, rebuilding it from metadata if missing"""
+        if self.index_path.exists():
+            entries = list(self._read_index().values())
+        else:
+            entries = []
+            metadata_files = sorted(self.metadata_dir.glob("*.json"), key=lambda x: x.stat().st_ctime)
+            for metadata_file in metadata_files:
+                try:
+                    entries.append(self._summarize(_sync_read_json(metadata_file)))
+                except Exception as e:
+                    logger.error(f"Error indexing metadata for {metadata_file.stem}: {str(e)}")
+        
+        tmp_path = self.index_path.with_suffix(".jsonl.tmp")
+        tmp_path.write_text("".join(json.dumps(entry) + "\n" for entry in entries))
+        os.replace(tmp_path, self.index_path)
     
     async def process_uploaded_file(
         self,
@@ -32,16 +155,29 @@ class FileService:
         # Generate unique file ID
         file_id = str(uuid.uuid4())
         
-        # Create file hash for deduplication
-        file_hash = hashlib.sha256(content).hexdigest()
-        
-        # Save file to disk
-        file_path = self.upload_dir / f"{file_id}_{filename}"
-        async with aiofiles.open(file_path, "wb") as f:
-            await f.write(content)
+        # Create file hash for deduplication; hashlib releases the GIL, so large uploads
+        # hash in a worker thread without stalling the event loop
+        file_hash = await asyncio.to_thread(_sha256_hex, content)
         
-        # Extract text content based on file type
-        extracted_text = await self._extract_text_content(file_path, content_type)
+        # Identical content already on disk: point at it and reuse its extracted text
+        existing = await asyncio.to_thread(self._claim_blob, file_hash, Path(filename).suffix.lower())
+        if existing:
+            existing_id, existing_path = existing
+            file_path = Path(existing_path)
+            existing_metadata = await self._load_metadata(existing_id)
+            if existing_metadata:
+                extracted_text = existing_metadata.get("extracted_text")
+            else:
+                extracted_text = await self._extract_text_content(file_path, content_type)
+        else:
+            # Save file to disk
+            file_path = self.upload_dir / f"{file_id}_{filename}"
+            async with aiofiles.open(file_path, "wb") as f:
+                await f.write(content)
+            await asyncio.to_thread(self._register_blob, file_hash, file_id, str(file_path))
+            
+            # Extract text content based on file type
+            extracted_text = await self._extract_text_content(file_path, content_type)
         
         # Create metadata
         metadata = {
@@ -58,8 +194,14 @@ class FileService:
             "processed": True
         }
         
-        # Save metadata
-        await self._save_metadata(file_id, metadata)
+        # Save metadata; without it nothing would ever release the reference taken above
+        try:
+            await self._save_metadata(file_id, metadata)
+            await asyncio.to_thread(self._append_index, self._summarize(metadata))
+        except Exception:
+            (self.metadata_dir / f"{file_id}.json").unlink(missing_ok=True)
+            await asyncio.to_thread(self._release_blob, file_hash, file_path)
+            raise
         
         return metadata
     
@@ -103,50 +245,44 @@ class FileService:
     async def _save_metadata(self, file_id: str, metadata: Dict[str, Any]):
         """Save file metadata to storage"""
         metadata_path = self.metadata_dir / f"{file_id}.json"
-        async with aiofiles.open(metadata_path, "w") as f:
-            await f.write(json.dumps(metadata, indent=2))
+        await asyncio.to_thread(_sync_write_json, metadata_path, metadata)
     
     async def _load_metadata(self, file_id: str) -> Optional[Dict[str, Any]]:
         """Load file metadata from storage"""
         metadata_path = self.metadata_dir / f"{file_id}.json"
         try:
-            async with aiofiles.open(metadata_path, "r") as f:
-                content = await f.read()
-                return json.loads(content)
+            return await asyncio.to_thread(_sync_read_json, metadata_path)
         except FileNotFoundError:
             return None
         except Exception as e:
             logger.error(f"Error loading metadata for {file_id}: {str(e)}")
             return None
     
+    @staticmethod
+    def _summarize(metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """Summary info for listings (not full content)"""
+        return {
+            "file_id": metadata["file_id"],
+            "filename": metadata["filename"],
+            "content_type": metadata["content_type"],
+            "size": metadata["size"],
+            "upload_time": metadata["upload_time"],
+            "processed": metadata["processed"],
+            "has_text": bool(metadata.get("extracted_text"))
+        }
+    
     async def list_files(self, skip: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
         """List uploaded files with metadata"""
-        files = []
-        metadata_files = list(self.metadata_dir.glob("*.json"))
+        entries = await asyncio.to_thread(self._read_index)
         
-        # Sort by creation time (newest first)
-        metadata_files.sort(key=lambda x: x.stat().st_ctime, reverse=True)
-        
-        for metadata_file in metadata_files[skip:skip+limit]:
-            file_id = metadata_file.stem
-            metadata = await self._load_metadata(file_id)
-            if metadata:
-                # Return summary info (not full content)
-                files.append({
-                    "file_id": metadata["file_id"],
-                    "filename": metadata["filename"],
-                    "content_type": metadata["content_type"],
-                    "size": metadata["size"],
-                    "upload_time": metadata["upload_time"],
-                    "processed": metadata["processed"],
-                    "has_text": bool(metadata.get("extracted_text"))
-                })
-        
-        return files
+        # Newest first
+        files = list(entries.values())
+        files.reverse()
+        return files[skip:skip+limit]
     
     async def count_files(self) -> int:
         """Count total number of uploaded files"""
-        return len(list(self.metadata_dir.glob("*.json")))
+        return len(await asyncio.to_thread(self._read_index))
     
     async def get_file_info(self, file_id: str) -> Optional[Dict[str, Any]]:
         """Get detailed file information"""
@@ -159,16 +295,16 @@ class FileService:
             if not metadata:
                 return False
             
-            # Delete file from disk
-            file_path = Path(metadata["file_path"])
-            if file_path.exists():
-                file_path.unlink()
+            # Delete file from disk unless other uploads share it
+            await asyncio.to_thread(self._release_blob, metadata.get("hash"), Path(metadata["file_path"]))
             
             # Delete metadata
             metadata_path = self.metadata_dir / f"{file_id}.json"
             if metadata_path.exists():
                 metadata_path.unlink()
             
+            await asyncio.to_thread(self._append_index, {"file_id": file_id, "deleted": True})
+            
             return True
             
         except Exception as e:
@@ -194,6 +330,7 @@ class FileService:
         
         # Save updated metadata
         await self._save_metadata(file_id, metadata)
+        await asyncio.to_thread(self._append_index, self._summarize(metadata))
         
         return metadata
     
@@ -209,23 +346,37 @@ class FileService:
         
         return None
     
-    async def search_files(self, query: str) -> List[Dict[str, Any]]:
-        """Search files by content or filename"""
+    def _sync_search(self, query: str) -> List[Dict[str, Any]]:
+        """Match filenames from the index; only files with extracted text are opened for content search"""
         results = []
-        metadata_files = list(self.metadata_dir.glob("*.json"))
+        query = query.lower()
         
-        for metadata_file in metadata_files:
-            file_id = metadata_file.stem
-            metadata = await self._load_metadata(file_id)
-            if metadata:
-                # Search in filename
-                if query.lower() in metadata["filename"].lower():
-                    results.append(metadata)
-                # Search in extracted text
-                elif metadata.get("extracted_text") and query.lower() in metadata["extracted_text"].lower():
-                    results.append(metadata)
+        for file_id, entry in self._read_index().items():
+            # Search in filename
+            if query in entry["filename"].lower():
+                filename_matched = True
+            elif entry.get("has_text"):
+                filename_matched = False
+            else:
+                continue
+            
+            try:
+                metadata = _sync_read_json(self.metadata_dir / f"{file_id}.json")
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.error(f"Error loading metadata for {file_id}: {str(e)}")
+                continue
+            
+            # Search in extracted text
+            if filename_matched or (metadata.get("extracted_text") and query in metadata["extracted_text"].lower()):
+                results.append(metadata)
         
         return results
+    
+    async def search_files(self, query: str) -> List[Dict[str, Any]]:
+        """Search files by content or filename"""
+        return await asyncio.to_thread(self._sync_search, query)
 
 # Global instance
 file_service = FileService()
\ No newline at end of file
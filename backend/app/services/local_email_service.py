@@ -3,6 +3,7 @@ Local Email Service
 For development - logs emails to console or uses local SMTP
 """
 
+import asyncio
 import logging
 import smtplib
 from email.mime.text import MIMEText
@@ -12,6 +13,7 @@ from datetime import datetime, timedelta, timezone
 import secrets
 import hashlib
 import sqlite3
+import threading
 import os
 from app.core.config import settings
 
@@ -38,8 +40,12 @@ class LocalEmailService:
     def _init_local_db(self):
         """Initialize local SQLite database for email tokens"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            # One long-lived autocommit connection; the lock serializes access across threads
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._lock = threading.Lock()
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            cursor = self._conn.cursor()
             
             # Create verification tokens table
             cursor.execute("""
@@ -69,8 +75,10 @@ class LocalEmailService:
                 )
             """)
             
-            conn.commit()
-            conn.close()
+            # Token lookups filter on (email, token_hash)
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_ev_email_hash ON email_verification (email, token_hash)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_pr_email_hash ON password_reset (email, token_hash)")
+            
             logger.info("Local token database initialized")
         except Exception as e:
             logger.error(f"Failed to initialize local database: {e}")
@@ -83,6 +91,14 @@ class LocalEmailService:
         """Hash a token for secure storage"""
         return hashlib.sha256(token.encode()).hexdigest()
     
+    def _store_token(self, table: str, email: str, token_hash: str, user_id: str, expires_at: datetime):
+        """Insert a verification or password reset token"""
+        with self._lock:
+            self._conn.execute(f"""
+                INSERT INTO {table} (email, token_hash, user_id, expires_at)
+                VALUES (?, ?, ?, ?)
+            """, (email, token_hash, user_id, expires_at))
+    
     async def send_verification_email(self, email: str, user_id: str) -> bool:
         """Send email verification email"""
         try:
@@ -92,14 +108,7 @@ class LocalEmailService:
             expires_at = datetime.now(timezone.utc) + timedelta(hours=settings.verification_expiry_hours)
             
             # Store verification token in local database
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO email_verification (email, token_hash, user_id, expires_at)
-                VALUES (?, ?, ?, ?)
-            """, (email, token_hash, user_id, expires_at))
-            conn.commit()
-            conn.close()
+            await asyncio.to_thread(self._store_token, "email_verification", email, token_hash, user_id, expires_at)
             
             # Create verification URL
             verification_url = f"{self.frontend_url}/verify-email?token={token}&email={email}"
@@ -165,7 +174,7 @@ The WOPS AI Team
             if self.backend == 'console':
                 self._log_email_to_console(email, subject, text_body, verification_url)
             elif self.backend == 'smtp':
-                self._send_smtp_email(email, subject, text_body, html_body)
+                await asyncio.to_thread(self._send_smtp_email, email, subject, text_body, html_body)
             
             logger.info(f"Verification email sent successfully to {email}")
             return True
@@ -183,14 +192,7 @@ The WOPS AI Team
             expires_at = datetime.now(timezone.utc) + timedelta(hours=settings.password_reset_expiry_hours)
             
             # Store reset token in local database
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO password_reset (email, token_hash, user_id, expires_at)
-                VALUES (?, ?, ?, ?)
-            """, (email, token_hash, user_id, expires_at))
-            conn.commit()
-            conn.close()
+            await asyncio.to_thread(self._store_token, "password_reset", email, token_hash, user_id, expires_at)
             
             # Create reset URL
             reset_url = f"{self.frontend_url}/reset-password?token={token}&email={email}"
@@ -258,7 +260,7 @@ The WOPS AI Team
             if self.backend == 'console':
                 self._log_email_to_console(email, subject, text_body, reset_url)
             elif self.backend == 'smtp':
-                self._send_smtp_email(email, subject, text_body, html_body)
+                await asyncio.to_thread(self._send_smtp_email, email, subject, text_body, html_body)
             
             logger.info(f"Password reset email sent successfully to {email}")
             return True
@@ -312,25 +314,18 @@ The WOPS AI Team
             # Fallback to console logging
             self._log_email_to_console(to_email, subject, text_body, "")
     
-    async def verify_email_token(self, email: str, token: str) -> bool:
-        """Verify email verification token"""
-        try:
-            token_hash = self._hash_token(token)
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
+    def _consume_verification_token(self, email: str, token_hash: str) -> bool:
+        """Check a verification token and mark it verified"""
+        with self._lock:
             # Get token from database
-            cursor.execute("""
+            result = self._conn.execute("""
                 SELECT id, user_id, expires_at, verified 
                 FROM email_verification 
                 WHERE email = ? AND token_hash = ?
-            """, (email, token_hash))
+            """, (email, token_hash)).fetchone()
             
-            result = cursor.fetchone()
             if not result:
                 logger.warning(f"Verification token not found for email: {email}")
-                conn.close()
                 return False
             
             token_id, user_id, expires_at_str, verified = result
@@ -340,52 +335,46 @@ The WOPS AI Team
             if datetime.now(timezone.utc) > expires_at:
                 logger.warning(f"Verification token expired for email: {email}")
                 # Clean up expired token
-                cursor.execute("DELETE FROM email_verification WHERE id = ?", (token_id,))
-                conn.commit()
-                conn.close()
+                self._conn.execute("DELETE FROM email_verification WHERE id = ?", (token_id,))
                 return False
             
             # Check if already verified
             if verified:
                 logger.warning(f"Email already verified: {email}")
-                conn.close()
                 return True
             
             # Mark as verified
-            cursor.execute("""
+            self._conn.execute("""
                 UPDATE email_verification 
                 SET verified = TRUE, verified_at = CURRENT_TIMESTAMP 
                 WHERE id = ?
             """, (token_id,))
-            conn.commit()
-            conn.close()
-            
-            logger.info(f"Email successfully verified: {email}")
-            return True
+        
+        logger.info(f"Email successfully verified: {email}")
+        return True
+    
+    async def verify_email_token(self, email: str, token: str) -> bool:
+        """Verify email verification token"""
+        try:
+            token_hash = self._hash_token(token)
+            return await asyncio.to_thread(self._consume_verification_token, email, token_hash)
             
         except Exception as e:
             logger.error(f"Error verifying email token for {email}: {e}")
             return False
     
-    async def verify_password_reset_token(self, email: str, token: str) -> Optional[str]:
-        """Verify password reset token and return user_id if valid"""
-        try:
-            token_hash = self._hash_token(token)
-            
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
+    def _check_password_reset_token(self, email: str, token_hash: str) -> Optional[str]:
+        """Return the user_id for a valid, unused password reset token"""
+        with self._lock:
             # Get token from database
-            cursor.execute("""
+            result = self._conn.execute("""
                 SELECT id, user_id, expires_at, used 
                 FROM password_reset 
                 WHERE email = ? AND token_hash = ?
-            """, (email, token_hash))
+            """, (email, token_hash)).fetchone()
             
-            result = cursor.fetchone()
             if not result:
                 logger.warning(f"Password reset token not found for email: {email}")
-                conn.close()
                 return None
             
             token_id, user_id, expires_at_str, used = result
@@ -395,42 +384,43 @@ The WOPS AI Team
             if datetime.now(timezone.utc) > expires_at:
                 logger.warning(f"Password reset token expired for email: {email}")
                 # Clean up expired token
-                cursor.execute("DELETE FROM password_reset WHERE id = ?", (token_id,))
-                conn.commit()
-                conn.close()
-                return None
-            
-            # Check if token has been used
-            if used:
-                logger.warning(f"Password reset token already used for email: {email}")
-                conn.close()
+                self._conn.execute("DELETE FROM password_reset WHERE id = ?", (token_id,))
                 return None
-            
-            conn.close()
-            logger.info(f"Password reset token verified for email: {email}")
-            return user_id
+        
+        # Check if token has been used
+        if used:
+            logger.warning(f"Password reset token already used for email: {email}")
+            return None
+        
+        logger.info(f"Password reset token verified for email: {email}")
+        return user_id
+    
+    async def verify_password_reset_token(self, email: str, token: str) -> Optional[str]:
+        """Verify password reset token and return user_id if valid"""
+        try:
+            token_hash = self._hash_token(token)
+            return await asyncio.to_thread(self._check_password_reset_token, email, token_hash)
             
         except Exception as e:
             logger.error(f"Error verifying password reset token for {email}: {e}")
             return None
     
+    def _mark_reset_token_used(self, email: str, token_hash: str):
+        """Flag a password reset token as used"""
+        with self._lock:
+            self._conn.execute("""
+                UPDATE password_reset 
+                SET used = TRUE, used_at = CURRENT_TIMESTAMP 
+                WHERE email = ? AND token_hash = ?
+            """, (email, token_hash))
+    
     async def mark_password_reset_token_used(self, email: str, token: str) -> bool:
         """Mark password reset token as used"""
         try:
             token_hash = self._hash_token(token)
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             # Mark token as used
-            cursor.execute("""
-                UPDATE password_reset 
-                SET used = TRUE, used_at = CURRENT_TIMESTAMP 
-                WHERE email = ? AND token_hash = ?
-            """, (email, token_hash))
-            
-            conn.commit()
-            conn.close()
+            await asyncio.to_thread(self._mark_reset_token_used, email, token_hash)
             
             logger.info(f"Password reset token marked as used for email: {email}")
             return True
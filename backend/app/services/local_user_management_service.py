@@ -632,8 +632,8 @@ class LocalUserManagementService:
         
         return model_name in user.usage_limits.model_access
     
-    async def get_all_users(self, page: int = 1, limit: int = 50) -> Dict[str, Any]:
-        """Get paginated list of all users (admin only)"""
+    async def get_all_users(self, page: int = 1, limit: int = 50, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Get paginated list of all users (admin only); SQLite pages by offset, so cursor is ignored"""
         try:
             offset = (page - 1) * limit
             
@@ -5,7 +5,6 @@ Supports both PostgreSQL (RDS) and DynamoDB backends
 
 import logging
 import json
-import boto3
 import psycopg2
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timezone
@@ -13,6 +12,7 @@ from uuid import uuid4
 from pydantic import BaseModel
 import os
 from contextlib import contextmanager
+from ..core.aws_clients import get_dynamodb_resource
 
 logger = logging.getLogger(__name__)
 
@@ -66,8 +66,7 @@ class ScalableChatService:
 
     def _init_dynamodb(self):
         """Initialize DynamoDB for serverless deployment"""
-        aws_region = os.getenv('AWS_REGION', 'us-east-1')
-        self.dynamodb = boto3.resource('dynamodb', region_name=aws_region)
+        self.dynamodb = get_dynamodb_resource()
         
         # Table names
         self.messages_table_name = os.getenv('DYNAMODB_MESSAGES_TABLE', 'wops-ai-messages')
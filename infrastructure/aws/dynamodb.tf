@@ -17,12 +17,30 @@ resource "aws_dynamodb_table" "users" {
     type = "S"
   }
 
+  attribute {
+    name = "entity_type"
+    type = "S"
+  }
+
+  attribute {
+    name = "created_at"
+    type = "S"
+  }
+
   global_secondary_index {
     name            = "email-index"
     hash_key        = "email"
     projection_type = "ALL"
   }
 
+  global_secondary_index {
+    name               = "UsersByCreatedAt"
+    hash_key           = "entity_type"
+    range_key          = "created_at"
+    projection_type    = "INCLUDE"
+    non_key_attributes = ["email", "role", "usage_plan", "status", "is_email_verified", "last_login"]
+  }
+
   tags = {
     Name = "${var.project_name}-users"
   }
@@ -121,11 +121,13 @@ resource "aws_iam_policy" "ecs_dynamodb_access" {
         Effect = "Allow"
         Action = [
           "dynamodb:PutItem",
+          "dynamodb:BatchWriteItem",
           "dynamodb:GetItem",
           "dynamodb:UpdateItem",
           "dynamodb:DeleteItem",
           "dynamodb:Query",
-          "dynamodb:Scan"
+          "dynamodb:Scan",
+          "dynamodb:DescribeTable"
         ]
         Resource = [
           aws_dynamodb_table.users.arn,
@@ -163,7 +165,12 @@ resource "aws_iam_policy" "ecs_ses_access" {
         Effect = "Allow"
         Action = [
           "ses:SendEmail",
-          "ses:SendRawEmail"
+          "ses:SendRawEmail",
+          "ses:SendTemplatedEmail",
+          "ses:SendBulkTemplatedEmail",
+          "ses:CreateTemplate",
+          "ses:UpdateTemplate",
+          "ses:TestRenderTemplate"
         ]
         Resource = "*"
       }
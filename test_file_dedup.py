@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Test script to verify duplicate uploads share one blob and deletes release it correctly
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Add the backend directory to the path
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+# FileService keeps uploads/ and metadata/ relative to the working directory
+os.chdir(tempfile.mkdtemp(prefix="wops-file-dedup-"))
+
+from app.services.file_service import FileService
+
+
+def test_upload_duplicate_delete_delete():
+    """Two uploads of the same content share a blob that survives until the last delete"""
+    print("📁 Testing upload, duplicate upload, delete, delete...")
+    service = FileService()
+    content = b"agent,tickets\nalice,3\n"
+
+    async def run():
+        first = await service.process_uploaded_file("report.txt", content, "text/plain")
+        blob = Path(first["file_path"])
+        assert blob.exists(), "first upload was not written to disk"
+        print(f"✅ First upload stored at {blob}")
+
+        second = await service.process_uploaded_file("report.txt", content, "text/plain")
+        assert second["file_id"] != first["file_id"], "duplicate upload reused the file id"
+        assert Path(second["file_path"]) == blob, "duplicate upload wrote a second blob"
+        assert second["extracted_text"] == first["extracted_text"]
+        assert len(list(service.upload_dir.iterdir())) == 1
+        print("✅ Duplicate upload shares the first blob")
+
+        assert await service.delete_file(first["file_id"])
+        assert blob.exists(), "blob deleted while another upload still uses it"
+        assert await service.get_file_info(second["file_id"]) is not None
+        print("✅ First delete keeps the shared blob")
+
+        assert await service.delete_file(second["file_id"])
+        assert not blob.exists(), "blob left behind after the last delete"
+        assert await service.count_files() == 0
+        print("✅ Second delete removes the blob")
+
+        # The registry must not keep pointing at the deleted blob
+        third = await service.process_uploaded_file("report.txt", content, "text/plain")
+        assert Path(third["file_path"]).exists()
+        assert await service.delete_file(third["file_id"])
+        assert not Path(third["file_path"]).exists()
+        print("✅ Re-upload after deleting everything stores a fresh blob")
+
+    asyncio.run(run())
+
+
+def test_stale_registry_row_is_replaced():
+    """A registry row whose blob vanished is repointed at the next upload"""
+    print("\n🧹 Testing a stale registry row...")
+    service = FileService()
+    content = b"stale blob content"
+
+    async def run():
+        first = await service.process_uploaded_file("notes.txt", content, "text/plain")
+        # Simulate the blob disappearing without going through delete_file
+        Path(first["file_path"]).unlink()
+
+        second = await service.process_uploaded_file("notes.txt", content, "text/plain")
+        assert Path(second["file_path"]).exists(), "upload was pointed at a missing blob"
+
+        third = await service.process_uploaded_file("notes.txt", content, "text/plain")
+        assert third["file_path"] == second["file_path"], "registry still points at the missing blob"
+        print("✅ Registry follows the newly written blob")
+
+        for uploaded in (first, second, third):
+            await service.delete_file(uploaded["file_id"])
+        assert not Path(second["file_path"]).exists()
+
+    asyncio.run(run())
+
+
+def test_failed_metadata_write_releases_claim():
+    """A duplicate upload whose metadata cannot be saved does not pin the blob"""
+    print("\n💥 Testing a failed metadata write...")
+    service = FileService()
+    content = b"claimed then abandoned"
+
+    async def run():
+        first = await service.process_uploaded_file("data.txt", content, "text/plain")
+
+        save_metadata = service._save_metadata
+
+        async def failing_save(file_id, metadata):
+            raise OSError("disk full")
+
+        service._save_metadata = failing_save
+        try:
+            await service.process_uploaded_file("data.txt", content, "text/plain")
+            raise AssertionError("metadata failure was swallowed")
+        except OSError:
+            pass
+        finally:
+            service._save_metadata = save_metadata
+
+        assert await service.delete_file(first["file_id"])
+        assert not Path(first["file_path"]).exists(), "failed upload left a reference on the blob"
+        print("✅ Failed upload released its reference")
+
+    asyncio.run(run())
+
+
+def main():
+    """Run all tests"""
+    print("🚀 Testing file deduplication")
+    print("=" * 50)
+
+    success = True
+    for test in (test_upload_duplicate_delete_delete, test_stale_registry_row_is_replaced, test_failed_metadata_write_releases_claim):
+        try:
+            test()
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+            success = False
+
+    print("\n" + "=" * 50)
+    if success:
+        print("🎉 All tests passed!")
+    else:
+        print("❌ Some tests failed. Check the errors above.")
+
+    return success
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)